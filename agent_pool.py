@@ -0,0 +1,87 @@
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from log_config import bot_logger
+
+# === Configuración del pool ===
+# Número máximo de invocaciones del agente ejecutándose a la vez (global)
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "8"))
+
+
+class AgentPool:
+    """Ejecuta llamadas bloqueantes (agent.invoke) fuera del event loop.
+
+    - Concurrencia global limitada a `max_workers`.
+    - Orden FIFO por usuario: los mensajes de un mismo usuario se procesan uno tras otro.
+    - Métricas de profundidad de cola y tiempo de espera.
+    """
+
+    def __init__(self, max_workers: int = AGENT_MAX_CONCURRENCY):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="trakii-agent")
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._user_locks: dict = {}
+        self._user_pending: dict = {}
+
+        # 📊 Métricas
+        self.queue_depth = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def run(self, user_id, fn, *args, **kwargs):
+        lock = self._user_locks.setdefault(user_id, asyncio.Lock())
+        self._user_pending[user_id] = self._user_pending.get(user_id, 0) + 1
+        self.queue_depth += 1
+        enqueued_at = time.perf_counter()
+        queued = True
+
+        try:
+            async with lock:
+                async with self._semaphore:
+                    wait = time.perf_counter() - enqueued_at
+                    self.queue_depth -= 1
+                    queued = False
+                    self.in_flight += 1
+                    self._record_wait(wait)
+                    bot_logger.info(
+                        f"[POOL] UserID: {user_id} - Espera: {wait * 1000:.0f} ms - "
+                        f"En cola: {self.queue_depth} - En curso: {self.in_flight}/{self.max_workers}",
+                        extra={"user_id": user_id, "wait_ms": round(wait * 1000, 1)},
+                    )
+                    try:
+                        loop = asyncio.get_running_loop()
+                        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+                    finally:
+                        self.in_flight -= 1
+                        self.completed += 1
+        finally:
+            if queued:
+                self.queue_depth -= 1
+            self._user_pending[user_id] -= 1
+            if not self._user_pending[user_id]:
+                # Libera el lock del usuario cuando no tiene mensajes pendientes
+                del self._user_pending[user_id]
+                self._user_locks.pop(user_id, None)
+
+    def _record_wait(self, wait: float):
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def stats(self) -> dict:
+        started = self.completed + self.in_flight
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "avg_wait_ms": round(self.total_wait / started * 1000, 1) if started else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "max_workers": self.max_workers,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=False)
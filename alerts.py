@@ -0,0 +1,545 @@
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from telegram.error import RetryAfter
+
+from log_config import bot_logger, error_logger
+from device_cache import device_cache
+from device_resolver import ID_PATTERN, fold, name_pattern, normalize
+from metrics import span
+from reply_stream import retry_seconds
+
+# === Configuración de alertas (push) ===
+ALERTS_ENABLED = os.getenv("ALERTS_ENABLED", "true").lower() in ("1", "true", "yes")
+ALERTS_DB = os.getenv("ALERTS_DB", "state/trakii-alerts.db")
+# Segundos entre evaluaciones (con POSITION_STREAM_ENABLED se leen las posiciones del socket, sin HTTP)
+ALERTS_INTERVAL = float(os.getenv("ALERTS_INTERVAL", "30"))
+# Muestras seguidas con el mismo valor para confirmar un cambio (filtra saltos del GPS)
+ALERTS_CONFIRMATIONS = int(os.getenv("ALERTS_CONFIRMATIONS", "2"))
+# Segundos mínimos entre dos avisos de la misma regla, dispositivo y geocerca
+ALERTS_COOLDOWN = float(os.getenv("ALERTS_COOLDOWN", "900"))
+ALERTS_GEOFENCE_TTL = float(os.getenv("ALERTS_GEOFENCE_TTL", "600"))
+ALERTS_MAX_PER_USER = int(os.getenv("ALERTS_MAX_PER_USER", "20"))
+# Límite global de Telegram: ~30 mensajes/s entre todos los chats
+ALERTS_SEND_RATE = float(os.getenv("ALERTS_SEND_RATE", "20"))
+ALERTS_MAX_LINES = 20
+# Tamaño de celda (grados) del índice espacial de geocercas
+GEOFENCE_GRID_DEG = 0.01
+# Geocercas que ocupan más celdas se comprueban siempre (sin índice)
+GEOFENCE_MAX_CELLS = 2500
+# Estado de reglas sin tocar durante este tiempo se descarta
+STATE_MAX_AGE = 24 * 3600
+
+KNOTS_TO_KPH = 1.852
+METERS_PER_DEGREE = 111320.0
+
+# Reglas y sus alias en los comandos
+RULES = {
+    "overspeed": {"label": "exceso de velocidad", "unit": "km/h", "default": 80},
+    "battery": {"label": "batería baja", "unit": "%", "default": 20},
+    "geofence": {"label": "entrada/salida de geocerca", "unit": None, "default": None},
+    "offline": {"label": "sin reportar", "unit": "min", "default": 30},
+}
+RULE_ALIASES = {
+    "velocidad": "overspeed", "exceso": "overspeed", "speed": "overspeed", "overspeed": "overspeed",
+    "bateria": "battery", "battery": "battery",
+    "geocerca": "geofence", "geocercas": "geofence", "zona": "geofence", "geofence": "geofence",
+    "desconexion": "offline", "offline": "offline", "conexion": "offline",
+}
+ALL_DEVICES_PATTERN = re.compile(r"\b(todos|todas|all)\b")
+# Umbral: el primer número que queda tras quitar los dispositivos ("camion 12 a 90 km/h" -> 90),
+# con decimales ("72.5", "72,5") y unidad opcional pegada o separada ("90km/h", "15 %")
+THRESHOLD_PATTERN = re.compile(
+    r"(?<![\w.,])(\d+(?:[.,]\d+)?)\s*(km\s*/\s*h|kmh|kph|kms|km|%|minutos|min)?(?![\w.,])"
+)
+# Unidades aceptadas por regla (sin espacios ni "/")
+RULE_UNITS = {"overspeed": {"kmh", "kph", "kms", "km"}, "battery": {"%"}, "offline": {"minutos", "min"}}
+
+ALERTS_HELP = (
+    "Uso:\n"
+    "/alerta velocidad <dispositivo|todos> [km/h]\n"
+    "/alerta bateria <dispositivo|todos> [%]\n"
+    "/alerta geocerca <dispositivo|todos> [geocerca]\n"
+    "/alerta desconexion <dispositivo|todos> [minutos]\n"
+    "/alertas para ver tus alertas y /quitar_alerta <número|todas> para borrarlas."
+)
+
+
+# === 🗄️ Suscripciones (SQLite, compartido por los workers) ===
+class AlertStore:
+    def __init__(self, path: str = ALERTS_DB):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS subscriptions ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, chat_id INTEGER NOT NULL,"
+            " rule TEXT NOT NULL, device_ids TEXT, threshold REAL, geofence TEXT, created_at REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row(row) -> dict:
+        sub = dict(row)
+        sub["device_ids"] = json.loads(sub["device_ids"]) if sub["device_ids"] else None
+        return sub
+
+    def add(self, user_id: int, chat_id: int, rule: str, device_ids, threshold=None, geofence=None) -> int:
+        cursor = self._connect().execute(
+            "INSERT INTO subscriptions (user_id, chat_id, rule, device_ids, threshold, geofence, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, chat_id, rule, json.dumps(device_ids) if device_ids else None, threshold, geofence, time.time()),
+        )
+        return cursor.lastrowid
+
+    def for_user(self, user_id: int) -> list:
+        rows = self._connect().execute("SELECT * FROM subscriptions WHERE user_id = ? ORDER BY id", (user_id,))
+        return [self._row(r) for r in rows]
+
+    def remove(self, user_id: int, sub_id: int = None) -> int:
+        """Borra una suscripción del usuario (o todas si sub_id es None). Devuelve cuántas se borraron."""
+        if sub_id is None:
+            return self._connect().execute("DELETE FROM subscriptions WHERE user_id = ?", (user_id,)).rowcount
+        return self._connect().execute(
+            "DELETE FROM subscriptions WHERE user_id = ? AND id = ?", (user_id, sub_id)
+        ).rowcount
+
+    def all(self) -> list:
+        return [self._row(r) for r in self._connect().execute("SELECT * FROM subscriptions")]
+
+
+# === 🗺️ Geocercas de Traccar con índice espacial ===
+class Geofence:
+    """Geocerca circular o poligonal a partir del WKT de Traccar (coordenadas en orden lat lon)."""
+
+    def __init__(self, geofence_id: int, name: str, area: str):
+        self.id = geofence_id
+        self.name = name
+        numbers = [float(n) for n in re.findall(r"-?\d+(?:\.\d+)?", area)]
+        shape = area.strip().split("(", 1)[0].strip().upper()
+        if shape == "CIRCLE" and len(numbers) == 3:
+            self.center = (numbers[0], numbers[1])
+            self.radius = numbers[2]
+            self.polygon = None
+            dlat = self.radius / METERS_PER_DEGREE
+            dlon = dlat / max(0.01, math.cos(math.radians(numbers[0])))
+            self.bbox = (numbers[0] - dlat, numbers[1] - dlon, numbers[0] + dlat, numbers[1] + dlon)
+        elif shape == "POLYGON" and len(numbers) >= 6:
+            self.polygon = list(zip(numbers[0::2], numbers[1::2]))
+            lats, lons = [p[0] for p in self.polygon], [p[1] for p in self.polygon]
+            self.bbox = (min(lats), min(lons), max(lats), max(lons))
+        else:
+            raise ValueError(f"geocerca no soportada: {shape}")
+
+    def contains(self, lat: float, lon: float) -> bool:
+        if not (self.bbox[0] <= lat <= self.bbox[2] and self.bbox[1] <= lon <= self.bbox[3]):
+            return False
+        if self.polygon is None:
+            return _distance_m(lat, lon, *self.center) <= self.radius
+        # Ray casting
+        inside = False
+        points = self.polygon
+        j = len(points) - 1
+        for i in range(len(points)):
+            (lat_i, lon_i), (lat_j, lon_j) = points[i], points[j]
+            if (lon_i > lon) != (lon_j > lon) and lat < (lat_j - lat_i) * (lon - lon_i) / (lon_j - lon_i) + lat_i:
+                inside = not inside
+            j = i
+        return inside
+
+
+def _distance_m(lat1, lon1, lat2, lon2) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371008.8 * math.asin(math.sqrt(a))
+
+
+class GeofenceIndex:
+    """Rejilla uniforme de GEOFENCE_GRID_DEG grados: cada punto solo se compara con las
+    geocercas cuyo rectángulo toca su celda, no con todas las de la cuenta."""
+
+    def __init__(self, geofences: list, cell: float = GEOFENCE_GRID_DEG):
+        self.geofences = {g.id: g for g in geofences}
+        self.cell = cell
+        self._grid: dict = {}
+        self._large = []
+        for g in geofences:
+            lat0, lon0, lat1, lon1 = (int(math.floor(v / cell)) for v in g.bbox)
+            if (lat1 - lat0 + 1) * (lon1 - lon0 + 1) > GEOFENCE_MAX_CELLS:
+                self._large.append(g)
+                continue
+            for i in range(lat0, lat1 + 1):
+                for j in range(lon0, lon1 + 1):
+                    self._grid.setdefault((i, j), []).append(g)
+
+    def containing(self, lat: float, lon: float) -> set:
+        """IDs de las geocercas que contienen el punto."""
+        candidates = self._grid.get((int(math.floor(lat / self.cell)), int(math.floor(lon / self.cell))), [])
+        return {g.id for g in candidates if g.contains(lat, lon)} | {g.id for g in self._large if g.contains(lat, lon)}
+
+
+class GeofenceCache:
+    """Índice de geocercas por cuenta, renovado cada ALERTS_GEOFENCE_TTL segundos."""
+
+    def __init__(self, ttl: float = ALERTS_GEOFENCE_TTL):
+        self.ttl = ttl
+        self._entries: dict = {}
+        self._lock = threading.Lock()
+
+    def get(self, client) -> GeofenceIndex:
+        key = (client.base_url, client.username)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        geofences = []
+        for item in client.get("/api/geofences").json():
+            try:
+                geofences.append(Geofence(item["id"], item.get("name") or str(item["id"]), item.get("area") or ""))
+            except ValueError as e:
+                bot_logger.debug(f"[ALERTS] Geocerca {item.get('id')} ignorada: {e}")
+        index = GeofenceIndex(geofences)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), index)
+        return index
+
+
+geofence_cache = GeofenceCache()
+
+
+# === ⏲️ Antirrebote ===
+class Debouncer:
+    """Estado confirmado por clave: un cambio cuenta tras `confirmations` muestras
+    seguidas, y los avisos de una misma clave se espacian al menos `cooldown` segundos."""
+
+    def __init__(self, confirmations: int = ALERTS_CONFIRMATIONS, cooldown: float = ALERTS_COOLDOWN):
+        self.confirmations = max(1, confirmations)
+        self.cooldown = cooldown
+        self._state: dict = {}  # clave -> [confirmado, candidato, veces, último aviso, última muestra]
+
+    def __contains__(self, key) -> bool:
+        return key in self._state
+
+    def update(self, key, value, now: float, initial=None) -> bool:
+        """Registra una muestra; True si confirma un cambio de estado.
+
+        Sin `initial`, la primera muestra de una clave solo fija la línea base.
+        """
+        state = self._state.get(key)
+        if state is None:
+            if initial is None:
+                self._state[key] = [value, value, 0, 0.0, now]
+                return False
+            state = self._state[key] = [initial, initial, 0, 0.0, now]
+        state[4] = now
+        if value == state[0]:
+            state[1], state[2] = value, 0
+            return False
+        if value != state[1]:
+            state[1], state[2] = value, 0
+        state[2] += 1
+        if state[2] < self.confirmations:
+            return False
+        state[0], state[2] = value, 0
+        return True
+
+    def confirmed(self, key):
+        state = self._state.get(key)
+        return state[0] if state else None
+
+    def settled(self, key) -> bool:
+        """Sin cambio pendiente de confirmar."""
+        state = self._state.get(key)
+        return state is None or state[2] == 0
+
+    def cooled(self, key, now: float) -> bool:
+        """True (y anota el aviso) si pasó el cooldown desde el último aviso de la clave."""
+        state = self._state[key]
+        if now - state[3] < self.cooldown:
+            return False
+        state[3] = now
+        return True
+
+    def forget(self, key):
+        self._state.pop(key, None)
+
+    def prune(self, now: float, max_age: float = STATE_MAX_AGE):
+        for key in [k for k, s in self._state.items() if now - s[4] > max_age]:
+            del self._state[key]
+
+
+# === 🔔 Motor de evaluación ===
+def _timestamp(value) -> float:
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp() if value else 0.0
+
+
+class AlertEngine:
+    """Bucle único que evalúa todas las suscripciones y envía avisos agrupados por chat.
+
+    Por cada cuenta con suscripciones se obtienen las posiciones una sola vez por
+    ciclo (socket si está activo, si no una petición agrupada a /api/positions), así
+    que el coste no crece con el número de usuarios que preguntan "¿dónde está?".
+    """
+
+    def __init__(self, store: AlertStore, credentials_for, notify, interval: float = ALERTS_INTERVAL):
+        # credentials_for(user_id) -> cliente Traccar (o None); notify(chat_id, texto) envía un mensaje
+        self.store = store
+        self.credentials_for = credentials_for
+        self.notify = notify
+        self.interval = interval
+        self.debouncer = Debouncer()
+        self._last_position: dict = {}  # (cuenta, deviceId) -> id de la última posición evaluada
+        self._tracked: dict = {}        # (suscripción, deviceId) -> claves de geocercas en seguimiento
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trakii-alerts", daemon=True)
+        self.cycles = 0
+        self.last_cycle_ms = 0.0
+        self.notifications = 0
+        self.events = 0
+
+    def start(self):
+        self._thread.start()
+        bot_logger.info(f"[ALERTS] Motor de alertas iniciado (cada {self.interval:.0f}s)")
+
+    def stop(self):
+        self._stopped.set()
+
+    def stats(self) -> dict:
+        return {"cycles": self.cycles, "last_cycle_ms": self.last_cycle_ms,
+                "events": self.events, "notifications": self.notifications}
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                error_logger.error(f"[ALERTS] Error en el ciclo de alertas: {e}", exc_info=True)
+
+    def run_once(self, now: float = None) -> int:
+        """Evalúa todas las suscripciones una vez; devuelve el número de mensajes enviados."""
+        started = time.perf_counter()
+        now = now or time.time()
+        accounts: dict = {}
+        for sub in self.store.all():
+            client = self.credentials_for(sub["user_id"])
+            if client is not None:
+                accounts.setdefault((client.base_url, client.username), (client, []))[1].append(sub)
+
+        events: dict = {}  # chat_id -> [líneas]
+        for client, subs in accounts.values():
+            try:
+                for chat_id, line in self._evaluate_account(client, subs, now):
+                    events.setdefault(chat_id, []).append(line)
+            except Exception as e:
+                error_logger.error(f"[ALERTS] No se pudo evaluar la cuenta {client.username}: {e}")
+        self.debouncer.prune(now)
+        for baseline in [b for b in self._tracked if b not in self.debouncer]:
+            del self._tracked[baseline]
+        sent = self._deliver(events)
+        self.cycles += 1
+        self.last_cycle_ms = round((time.perf_counter() - started) * 1000, 1)
+        return sent
+
+    def _evaluate_account(self, client, subs: list, now: float):
+        from my_trakii_agent import fetch_positions
+
+        resolver = device_cache.resolver(client)
+        if any(sub["device_ids"] is None for sub in subs):
+            devices = resolver.devices
+        else:
+            devices = resolver.by_ids(sorted({i for sub in subs for i in sub["device_ids"]}))
+        names = {d["id"]: d["name"] for d in devices}
+        positions = fetch_positions(client, devices)
+        geofences = geofence_cache.get(client) if any(sub["rule"] == "geofence" for sub in subs) else None
+
+        # Solo las posiciones nuevas disparan reglas de posición (la de desconexión se mira siempre)
+        fresh = set()
+        for device_id, p in positions.items():
+            key = (client.username, device_id)
+            marker = p.get("id") or p.get("fixTime")
+            if self._last_position.get(key) != marker:
+                self._last_position[key] = marker
+                fresh.add(device_id)
+
+        for sub in subs:
+            device_ids = sub["device_ids"] if sub["device_ids"] is not None else list(names)
+            for device_id in device_ids:
+                p = positions.get(device_id)
+                if p is None or device_id not in names:
+                    continue
+                if sub["rule"] != "offline" and device_id not in fresh:
+                    continue
+                for text in self._check(sub, names[device_id], device_id, p, geofences, now):
+                    self.events += 1
+                    yield sub["chat_id"], text
+
+    def _check(self, sub: dict, name: str, device_id: int, p: dict, geofences, now: float) -> list:
+        rule, threshold = sub["rule"], sub["threshold"]
+        key = (sub["id"], device_id)
+        d = self.debouncer
+
+        # Las reglas de umbral parten de "normal": un dispositivo que ya incumple la regla al crear
+        # la alerta avisa igual (tras las confirmaciones); solo las geocercas fijan una línea base
+        if rule == "overspeed":
+            speed = round((p.get("speed") or 0) * KNOTS_TO_KPH, 1)
+            if d.update(key, speed > threshold, now, initial=False) and d.confirmed(key) and d.cooled(key, now):
+                return [f"🚨 {name} va a {speed} km/h (límite {threshold:g} km/h)"]
+        elif rule == "battery":
+            level = (p.get("attributes") or {}).get("batteryLevel")
+            if (level is not None and d.update(key, level < threshold, now, initial=False)
+                    and d.confirmed(key) and d.cooled(key, now)):
+                return [f"🔋 {name} tiene la batería al {level:g} % (umbral {threshold:g} %)"]
+        elif rule == "offline":
+            age_min = (now - _timestamp(p.get("serverTime") or p.get("fixTime"))) / 60
+            if d.update(key, age_min > threshold, now, initial=False) and d.cooled(key, now):
+                if d.confirmed(key):
+                    return [f"📴 {name} no reporta desde hace {age_min:.0f} min"]
+                return [f"📶 {name} volvió a reportar"]
+        elif rule == "geofence" and geofences is not None:
+            return self._check_geofences(sub, name, device_id, p, geofences, now)
+        return []
+
+    def _check_geofences(self, sub: dict, name: str, device_id: int, p: dict, geofences: GeofenceIndex, now: float) -> list:
+        inside = geofences.containing(p["latitude"], p["longitude"])
+        if sub["geofence"]:
+            inside = {g for g in inside if normalize(geofences.geofences[g].name) == sub["geofence"]}
+        # La primera muestra del dispositivo fija la línea base; después, una geocerca nueva parte de "fuera"
+        baseline = (sub["id"], device_id)
+        initial = False if baseline in self.debouncer else None
+        self.debouncer.update(baseline, True, now)
+
+        lines = []
+        tracked = {key[2] for key in self._tracked.get(baseline, ())}
+        for geofence_id in inside | tracked:
+            key = (sub["id"], device_id, geofence_id)
+            self._tracked.setdefault(baseline, set()).add(key)
+            changed = self.debouncer.update(key, geofence_id in inside, now, initial)
+            geofence = geofences.geofences.get(geofence_id)
+            if changed and geofence is not None and self.debouncer.cooled(key, now):
+                verb = "entró en" if self.debouncer.confirmed(key) else "salió de"
+                lines.append(f"📍 {name} {verb} «{geofence.name}»")
+            if not self.debouncer.confirmed(key) and self.debouncer.settled(key):
+                # Fuera y sin cambios pendientes: no hace falta seguirla
+                self.debouncer.forget(key)
+                self._tracked[baseline].discard(key)
+        return lines
+
+    def _deliver(self, events: dict) -> int:
+        sent = 0
+        for chat_id, lines in events.items():
+            text = "🔔 Alertas:\n" + "\n".join(lines[:ALERTS_MAX_LINES])
+            if len(lines) > ALERTS_MAX_LINES:
+                text += f"\n… y {len(lines) - ALERTS_MAX_LINES} más."
+            for attempt in range(2):
+                try:
+                    with span("telegram", "send_alert"):
+                        self.notify(chat_id, text)
+                    sent += 1
+                    break
+                except RetryAfter as e:
+                    if attempt:
+                        error_logger.error(f"[ALERTS] No se pudo avisar al chat {chat_id}: {e}")
+                        break
+                    time.sleep(retry_seconds(e.retry_after))
+                except Exception as e:
+                    error_logger.error(f"[ALERTS] No se pudo avisar al chat {chat_id}: {e}")
+                    break
+            time.sleep(1 / ALERTS_SEND_RATE)
+        self.notifications += sent
+        return sent
+
+
+# === 💬 Comandos ===
+def describe(sub: dict, resolver) -> str:
+    rule = RULES[sub["rule"]]
+    if sub["device_ids"] is None:
+        devices = "todos los dispositivos"
+    else:
+        devices = ", ".join(d["name"] for d in resolver.by_ids(sub["device_ids"])) or "dispositivos eliminados"
+    text = f"#{sub['id']} {rule['label']} — {devices}"
+    if sub["threshold"] is not None:
+        text += f" ({sub['threshold']:g} {rule['unit']})"
+    if sub["geofence"]:
+        text += f" ({sub['geofence']})"
+    return text
+
+
+def subscribe(store: AlertStore, client, user_id: int, chat_id: int, text: str) -> str:
+    """Crea la suscripción pedida en `/alerta ...` y devuelve la respuesta para el usuario."""
+    parts = text.split(None, 1)
+    rule = RULE_ALIASES.get(normalize(parts[0])) if parts else None
+    if rule is None:
+        return ALERTS_HELP
+    if len(store.for_user(user_id)) >= ALERTS_MAX_PER_USER:
+        return f"⚠️ Ya tienes {ALERTS_MAX_PER_USER} alertas. Borra alguna con /quitar_alerta."
+    rest = parts[1] if len(parts) > 1 else ""
+
+    # Primero los dispositivos: los números de sus nombres ("moto 3") no son el umbral
+    resolver = device_cache.resolver(client)
+    devices = None if ALL_DEVICES_PATTERN.search(normalize(rest)) else resolver.resolve(rest)
+    if devices == []:
+        return "⚠️ No encontré el dispositivo. Indica su nombre o escribe «todos».\n\n" + ALERTS_HELP
+    # Se quitan sobre el texto sin acentos pero con puntuación, para no perder "72,5" ni "km/h"
+    leftover = fold(ID_PATTERN.sub(" ", rest))
+    for d in sorted(devices or [], key=lambda d: len(d["name"]), reverse=True):
+        leftover = name_pattern(d["name"]).sub(" ", leftover, count=1)
+    leftover = ALL_DEVICES_PATTERN.sub(" ", leftover)
+
+    threshold, geofence = RULES[rule]["default"], None
+    if rule == "geofence":
+        names = {normalize(g.name) for g in geofence_cache.get(client).geofences.values()}
+        if not names:
+            return "⚠️ Tu cuenta no tiene geocercas definidas en Traccar."
+        # La más larga primero: "bodega norte" antes que "bodega"
+        words = f" {normalize(leftover)} "
+        geofence = next((name for name in sorted(names, key=len, reverse=True) if f" {name} " in words), None)
+    elif m := THRESHOLD_PATTERN.search(leftover):
+        unit = re.sub(r"[\s/]", "", m.group(2) or "")
+        if unit and unit not in RULE_UNITS[rule]:
+            return f"⚠️ La alerta de {RULES[rule]['label']} se indica en {RULES[rule]['unit']}, no en «{m.group(2)}».\n\n" + ALERTS_HELP
+        threshold = float(m.group(1).replace(",", "."))
+    elif re.search(r"\d", leftover):
+        # Hay un número pero no se entiende: mejor avisar que crear la alerta con otro umbral
+        return f"⚠️ No entendí el umbral «{leftover.strip()}». Usa un número, p. ej. 90 o 72,5.\n\n" + ALERTS_HELP
+    device_ids = [d["id"] for d in devices] if devices is not None else None
+
+    sub_id = store.add(user_id, chat_id, rule, device_ids, threshold, geofence)
+    sub = {"id": sub_id, "rule": rule, "device_ids": device_ids, "threshold": threshold, "geofence": geofence}
+    bot_logger.info(f"[ALERTS] UserID: {user_id} - Nueva alerta {describe(sub, resolver)}", extra={"user_id": user_id})
+    return f"✅ Alerta creada: {describe(sub, resolver)}"
+
+
+def list_subscriptions(store: AlertStore, client, user_id: int) -> str:
+    subs = store.for_user(user_id)
+    if not subs:
+        return "No tienes alertas activas.\n\n" + ALERTS_HELP
+    resolver = device_cache.resolver(client)
+    return "🔔 Tus alertas:\n" + "\n".join(f"- {describe(sub, resolver)}" for sub in subs)
+
+
+def unsubscribe(store: AlertStore, user_id: int, text: str) -> str:
+    text = normalize(text)
+    if ALL_DEVICES_PATTERN.search(text):
+        removed = store.remove(user_id)
+        return f"🗑️ {removed} alertas eliminadas." if removed else "No tienes alertas activas."
+    if not text.isdigit():
+        return "Uso: /quitar_alerta <número|todas> (los números aparecen en /alertas)."
+    if store.remove(user_id, int(text)):
+        return f"🗑️ Alerta #{text} eliminada."
+    return f"⚠️ No tienes ninguna alerta #{text}."
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from device_resolver import normalize
+from log_config import bot_logger
+
+# === Configuración del caché de respuestas RAG ===
+ANSWER_CACHE_MAX = int(os.getenv("ANSWER_CACHE_MAX", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# Distancia coseno máxima para reutilizar la respuesta de una pregunta parecida
+ANSWER_CACHE_MAX_DISTANCE = float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", "0.08"))
+
+KNOWLEDGE_DB = "knowledge_db"
+# ingest.py actualiza este archivo cada vez que reconstruye la base de conocimiento
+INGEST_MARKER = os.path.join(KNOWLEDGE_DB, ".ingest_version")
+
+
+def mark_knowledge_updated():
+    os.makedirs(KNOWLEDGE_DB, exist_ok=True)
+    with open(INGEST_MARKER, "w", encoding="utf-8") as f:
+        f.write(str(time.time()))
+
+
+def _knowledge_version():
+    try:
+        return os.stat(INGEST_MARKER).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class _Answer:
+    __slots__ = ("answer", "vector", "created")
+
+    def __init__(self, answer: str, vector, created: float):
+        self.answer = answer
+        self.vector = vector
+        self.created = created
+
+
+class AnswerCache:
+    """Caché de respuestas de `handle_ask` en dos niveles.
+
+    1. Exacto: pregunta normalizada -> respuesta.
+    2. Semántico: se reutiliza la respuesta si el embedding de la nueva pregunta
+       está a menos de `max_distance` (distancia coseno) de uno guardado.
+
+    Expulsión LRU + TTL, y se vacía solo cuando `ingest.py` reconstruye `knowledge_db`.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX, ttl: float = ANSWER_CACHE_TTL,
+                 max_distance: float = ANSWER_CACHE_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries: OrderedDict = OrderedDict()
+        self._matrix = None  # vectores normalizados apilados (se reconstruye al cambiar)
+        self._matrix_keys: list = []
+        self._version = _knowledge_version()
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _check_version(self):
+        version = _knowledge_version()
+        if version != self._version:
+            bot_logger.info("[RAG-CACHE] Base de conocimiento reindexada: se vacía el caché de respuestas")
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _expired(self, entry: _Answer) -> bool:
+        return time.monotonic() - entry.created > self.ttl
+
+    def get_exact(self, question: str):
+        key = normalize(question)
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry.answer
+
+    def get_similar(self, vector):
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries.keys())
+                self._matrix = np.stack([self._entries[k].vector for k in self._matrix_keys])
+
+            query = _unit(vector)
+            similarities = self._matrix @ query
+            best = int(np.argmax(similarities))
+            key = self._matrix_keys[best]
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry) or 1.0 - similarities[best] > self.max_distance:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            return entry.answer
+
+    def put(self, question: str, vector, answer: str):
+        key = normalize(question)
+        with self._lock:
+            self._entries[key] = _Answer(answer, _unit(vector), time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        total = self.exact_hits + self.semantic_hits + self.misses
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / total, 3) if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+def _unit(vector):
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,121 @@
+"""Benchmark: motor de alertas push contra el Traccar falso de benchmarks/fakes.py.
+
+Simula una flota en movimiento, suscripciones de varios usuarios (velocidad,
+batería, geocercas y desconexión sobre todos sus dispositivos) y ejecuta ciclos
+del motor. Informa la duración de cada ciclo, las peticiones a Traccar (una por
+cuenta y ciclo, sin importar cuántos usuarios haya) y los avisos enviados, y
+compara el índice de geocercas con recorrerlas todas.
+
+Uso:
+    python benchmarks/bench_alerts.py [--devices 500] [--geofences 1000] [--users 50] [--accounts 5] [--cycles 10]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeTraccar  # noqa: E402
+
+
+def make_geofences(count: int, seed: int = 3) -> list:
+    rng = random.Random(seed)
+    geofences = []
+    for i in range(1, count + 1):
+        lat, lon = rng.uniform(-34.0, -33.0), rng.uniform(-71.0, -70.0)
+        if i % 2:
+            area = f"CIRCLE ({lat:.6f} {lon:.6f}, {rng.uniform(200, 3000):.1f})"
+        else:
+            d = rng.uniform(0.005, 0.03)
+            area = f"POLYGON (({lat:.6f} {lon:.6f}, {lat + d:.6f} {lon:.6f}, {lat + d:.6f} {lon + d:.6f}, {lat:.6f} {lon + d:.6f}, {lat:.6f} {lon:.6f}))"
+        geofences.append({"id": i, "name": f"Zona {i}", "area": area})
+    return geofences
+
+
+def move_fleet(traccar: FakeTraccar, rng: random.Random):
+    now = datetime.now(timezone.utc).isoformat()
+    for position_id, p in list(traccar.positions.items()):
+        if rng.random() < 0.05:
+            continue  # sin reportar este ciclo
+        p = dict(p, id=p["id"] + 1000000, fixTime=now, serverTime=now)
+        p["latitude"] += rng.uniform(-0.01, 0.01)
+        p["longitude"] += rng.uniform(-0.01, 0.01)
+        p["speed"] = round(rng.uniform(0, 70), 1)
+        p["attributes"] = dict(p["attributes"], batteryLevel=max(0, p["attributes"]["batteryLevel"] - rng.randint(0, 3)))
+        traccar.positions[position_id] = p
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--geofences", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--accounts", type=int, default=5)
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--traccar-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    traccar = FakeTraccar(devices=args.devices, latency=args.traccar_latency).start()
+    traccar.geofences = make_geofences(args.geofences)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update({
+            "TRACCAR_URL": traccar.url,
+            "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "bench"),
+            "POSITION_STREAM_ENABLED": "false",
+            "METRICS_PORT": "0",
+            "ALERTS_SEND_RATE": "100000",
+            # Los ciclos van seguidos: sin caché de posiciones cada ciclo ve la flota recién movida
+            "POSITIONS_CACHE_TTL": "0",
+            "MEMORY_DB": os.path.join(tmp, "memory.db"),
+        })
+        import alerts
+        from traccar_client import get_client
+
+        store = alerts.AlertStore(os.path.join(tmp, "alerts.db"))
+        for user in range(1, args.users + 1):
+            for rule in ("overspeed", "battery", "geofence", "offline"):
+                store.add(user, user, rule, None, alerts.RULES[rule]["default"])
+        clients = {user: get_client(f"cuenta{user % args.accounts}@bench", "bench") for user in range(1, args.users + 1)}
+        sent = []
+        engine = alerts.AlertEngine(store, clients.get, lambda chat_id, text: sent.append((chat_id, text)))
+
+        rng = random.Random(5)
+        durations = []
+        traccar.requests.clear()
+        for _ in range(args.cycles):
+            move_fleet(traccar, rng)
+            started = time.perf_counter()
+            engine.run_once()
+            durations.append(time.perf_counter() - started)
+        requests = dict(traccar.requests)
+
+        index = alerts.geofence_cache.get(clients[1])
+        points = [(rng.uniform(-34.0, -33.0), rng.uniform(-71.0, -70.0)) for _ in range(20000)]
+        started = time.perf_counter()
+        indexed = [index.containing(lat, lon) for lat, lon in points]
+        indexed_s = time.perf_counter() - started
+        started = time.perf_counter()
+        linear = [{g.id for g in index.geofences.values() if g.contains(lat, lon)} for lat, lon in points]
+        linear_s = time.perf_counter() - started
+        assert indexed == linear
+
+    traccar.stop()
+    ms = sorted(d * 1000 for d in durations)
+    print(f"{args.users} usuarios, {args.accounts} cuentas, {args.devices} dispositivos, {args.geofences} geocercas, "
+          f"{args.users * 4} suscripciones")
+    print(f"Ciclo: media {statistics.fmean(ms):.1f} ms, máx {ms[-1]:.1f} ms ({args.cycles} ciclos)")
+    print(f"Traccar: {requests}")
+    print(f"Eventos: {engine.events}  mensajes enviados: {len(sent)} "
+          f"({engine.events / max(1, len(sent)):.1f} eventos por mensaje)")
+    print(f"Geocercas, {len(points)} puntos: índice {indexed_s * 1000:.1f} ms, recorrido lineal {linear_s * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
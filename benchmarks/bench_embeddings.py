@@ -0,0 +1,76 @@
+"""Benchmark: recall y latencia de recuperación RAG por backend de embeddings.
+
+Indexa faq_trakii.json en un Chroma temporal por backend y usa cada pregunta
+del FAQ como consulta: acierta si entre los k primeros fragmentos está el de
+su propia respuesta. Mide la latencia sin caché (backend) y con caché.
+
+Uso:
+    python benchmarks/bench_embeddings.py [--backends openai local] [--k 3]
+
+El backend openai requiere OPENAI_API_KEY; local requiere sentence-transformers.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ingest  # noqa: E402
+from embeddings import CachedEmbeddings, create_backend  # noqa: E402
+
+FAQ = os.path.join(ROOT, "faq_trakii.json")
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+
+def evaluate(vectordb, embeddings, questions: list, k: int) -> tuple:
+    hits, latencies = 0, []
+    for seq_num, question in questions:
+        start = time.perf_counter()
+        vector = embeddings.embed_query(question)
+        docs = vectordb.similarity_search_by_vector(vector, k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += any(d.metadata.get("seq_num") == seq_num for d in docs)
+    return hits / len(questions), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["openai", "local"])
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(FAQ, encoding="utf-8") as f:
+        questions = [(i + 1, item["question"]) for i, item in enumerate(json.load(f))]
+
+    for backend in args.backends:
+        try:
+            base, model_id = create_backend(backend)
+        except Exception as e:
+            print(f"{backend:<8} omitido: {e}")
+            continue
+
+        with tempfile.TemporaryDirectory() as tmp:
+            embeddings = CachedEmbeddings(base, namespace=model_id, path=os.path.join(tmp, "cache.db"))
+            vectordb = ingest.open_vectordb(embeddings, persist_directory=os.path.join(tmp, "db"))
+            ingest.ingest(vectordb, [FAQ])
+
+            recall, cold = evaluate(vectordb, embeddings, questions, args.k)
+            _, warm = evaluate(vectordb, embeddings, questions, args.k)
+            print(
+                f"{model_id:<60} recall@{args.k}: {recall:.2%}  "
+                f"sin caché p50 {statistics.median(cold):7.1f} ms p95 {percentile(cold, 0.95):7.1f} ms  "
+                f"con caché p50 {statistics.median(warm):6.1f} ms p95 {percentile(warm, 0.95):6.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark: ingestión completa vs incremental de la base de conocimiento.
+
+Usa embeddings falsos deterministas (sin llamadas a OpenAI) y un Chroma temporal.
+
+Uso:
+    python benchmarks/bench_ingest.py [--entries 2000] [--changed 0.05]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding  # noqa: E402
+
+import ingest  # noqa: E402
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+    texts: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return super().embed_documents(texts)
+
+
+def write_faq(path: str, entries: list):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([{"question": f"Pregunta {i}", "answer": a} for i, a in enumerate(entries)], f, ensure_ascii=False)
+
+
+def run(label: str, vectordb, embeddings, sources: list):
+    embeddings.calls = embeddings.texts = 0
+    start = time.perf_counter()
+    stats = ingest.ingest(vectordb, sources)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<32} {elapsed:7.2f}s  textos embebidos: {embeddings.texts:6d}  llamadas: {embeddings.calls:4d}  "
+        f"(+{stats['added']} ={stats['unchanged']} -{stats['deleted']})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--changed", type=float, default=0.05)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    words = "rastreo gps batería dispositivo cuenta plataforma alerta ubicación velocidad soporte".split()
+    entries = [" ".join(rng.choice(words) for _ in range(rng.randint(40, 160))) + f" #{i}" for i in range(args.entries)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        faq = os.path.join(tmp, "faq.json")
+        embeddings = CountingEmbeddings(size=256)
+        vectordb = ingest.open_vectordb(embeddings, persist_directory=os.path.join(tmp, "db"))
+
+        write_faq(faq, entries)
+        run("Primera ingestión", vectordb, embeddings, [faq])
+        run("Reingestión sin cambios", vectordb, embeddings, [faq])
+
+        changed = rng.sample(range(len(entries)), int(len(entries) * args.changed))
+        for i in changed:
+            entries[i] += " (actualizado)"
+        write_faq(faq, entries[: int(len(entries) * 0.98)])
+        run(f"{args.changed:.0%} editadas + 2% borradas", vectordb, embeddings, [faq])
+
+
+if __name__ == "__main__":
+    main()
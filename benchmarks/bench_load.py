@@ -0,0 +1,256 @@
+"""Prueba de carga: reproduce updates sintéticos de Telegram contra el bot completo.
+
+Todo es local: Traccar falso (benchmarks/fakes.py) con latencia inyectable, LLM y
+embeddings deterministas y un Chroma temporal con faq_trakii.json. Los mensajes
+llegan a ritmo constante (carga abierta) y se mide throughput, percentiles de
+latencia (hasta el primer texto visible y hasta la respuesta final) y memoria.
+
+Uso:
+    python benchmarks/bench_load.py [--messages 500] [--rate 20] [--users 50] [--devices 200]
+                                    [--traccar-latency 0.05] [--llm-latency 0.3] [--target handle_message]
+                                    [--json resultados.json]
+
+--target invoke mide solo agent.invoke (sin pool, rate limits ni Telegram).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeTraccar, FakeUpdate, StubChatModel, StubEmbeddings  # noqa: E402
+
+# Intenciones sintéticas: (tipo, peso, plantilla)
+MIX = [
+    ("location", 30, "ubicación de camion {n}"),
+    ("speed", 20, "velocidad de camion {n}"),
+    ("status", 15, "estado de camion {n}"),
+    ("follow_up", 10, "¿y su velocidad?"),
+    ("list", 5, "lista de dispositivos"),
+    ("ask", 20, "{question}"),
+]
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+
+def summarize(values: list) -> dict:
+    ms = [v * 1000 for v in values]
+    return {
+        "count": len(ms),
+        "p50_ms": round(percentile(ms, 0.5), 1),
+        "p95_ms": round(percentile(ms, 0.95), 1),
+        "p99_ms": round(percentile(ms, 0.99), 1),
+        "max_ms": round(max(ms), 1) if ms else 0.0,
+        "mean_ms": round(statistics.fmean(ms), 1) if ms else 0.0,
+    }
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def synthetic_messages(count: int, users: int, devices: int, questions: list, seed: int = 11) -> list:
+    rng = random.Random(seed)
+    kinds, weights = [k for k, _, _ in MIX], [w for _, w, _ in MIX]
+    templates = {k: t for k, _, t in MIX}
+    messages = []
+    for _ in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        text = templates[kind].format(n=rng.randint(1, devices), question=rng.choice(questions))
+        messages.append((rng.randint(1, users), kind, text))
+    return messages
+
+
+def configure_environment(args, traccar_url: str, tmp: str):
+    # Antes de importar el bot: los módulos leen su configuración al importarse
+    os.environ.update({
+        "TRACCAR_URL": traccar_url,
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "bench"),
+        "TELEGRAM_TOKEN": "0:bench",
+        "USER_RATE_PER_MINUTE": "100000",
+        "USER_BURST": "100000",
+        "ACCOUNT_RATE_PER_MINUTE": "100000",
+        "ACCOUNT_BURST": "100000",
+        "METRICS_PORT": "0",
+        "POSITION_STREAM_ENABLED": "false",
+        "EMBEDDINGS_CACHE_DB": "",
+        "MEMORY_DB": os.path.join(tmp, "memory.db"),
+        "MEMORY_STORE_DB": os.path.join(tmp, "store.db"),
+        "STREAM_EDIT_INTERVAL": str(args.edit_interval),
+        "TENANTS_FILE": os.path.join(tmp, "tenants.json"),
+        "ALERTS_ENABLED": "false",
+        "ALERTS_DB": os.path.join(tmp, "alerts.db"),
+    })
+    # Usuarios repartidos entre --accounts cuentas (varios usuarios por cuenta, como en producción)
+    accounts = max(1, args.accounts)
+    with open(os.environ["TENANTS_FILE"], "w", encoding="utf-8") as f:
+        json.dump({
+            "accounts": {f"cuenta{i}": {"username": f"cuenta{i}@bench", "password": "bench"} for i in range(accounts)},
+            "users": {str(user): f"cuenta{user % accounts}" for user in range(1, args.users + 1)},
+        }, f)
+
+
+def install_stubs(args, tmp: str):
+    import ingest
+    import my_trakii_agent
+    from embeddings import CachedEmbeddings
+
+    llm = StubChatModel(latency=args.llm_latency, token_interval=args.token_interval)
+    embeddings = CachedEmbeddings(StubEmbeddings(size=384, latency=args.embed_latency), namespace="bench", path="")
+    vectordb = ingest.open_vectordb(embeddings, persist_directory=os.path.join(tmp, "knowledge_db"))
+    ingest.ingest(vectordb, [os.path.join(ROOT, "faq_trakii.json")])
+    my_trakii_agent._singletons.update({
+        "llm": llm,
+        "llm_router": llm.with_structured_output(my_trakii_agent.Router),
+        "embeddings": embeddings,
+        "vectordb": vectordb,
+    })
+    return my_trakii_agent
+
+
+async def replay(args, messages: list) -> tuple:
+    """Devuelve (resultados por mensaje, segundos totales)."""
+    import main
+
+    executor = ThreadPoolExecutor(max_workers=args.concurrency)
+    results = []
+
+    async def via_handle_message(user: int, kind: str, text: str):
+        update = FakeUpdate(user, text, api_latency=args.telegram_latency)
+        await main.handle_message(update, None)
+        message = update.message
+        failed = any("error inesperado" in text for _, text in message.replies) or message.last_text_at is None
+        results.append({
+            "kind": kind,
+            "failed": failed,
+            "latency": (message.last_text_at or time.perf_counter()) - message.created_at,
+            "first_text": (message.first_text_at or time.perf_counter()) - message.created_at,
+        })
+
+    async def via_invoke(user: int, kind: str, text: str):
+        config = {"configurable": {
+            "langgraph_user_id": f"telegram-{user}",
+            "thread_id": f"telegram-{user}",
+            "account": main.tenants.get(user).account,
+        }}
+        started = time.perf_counter()
+        failed = False
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(executor, lambda: main.get_agent().invoke({"user_input": {"message": text}}, config=config))
+        except Exception:
+            failed = True
+        latency = time.perf_counter() - started
+        results.append({"kind": kind, "failed": failed, "latency": latency, "first_text": latency})
+
+    run_one = via_invoke if args.target == "invoke" else via_handle_message
+    started = time.perf_counter()
+    tasks = []
+    for i, (user, kind, text) in enumerate(messages):
+        # Carga abierta: los mensajes llegan a su hora aunque el bot vaya atrasado
+        delay = started + i / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(run_one(user, kind, text)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    executor.shutdown()
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=20.0, help="mensajes por segundo")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--accounts", type=int, default=5)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--traccar-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--token-interval", type=float, default=0.01)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--telegram-latency", type=float, default=0.03)
+    parser.add_argument("--edit-interval", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=8, help="hilos para --target invoke")
+    parser.add_argument("--target", choices=["handle_message", "invoke"], default="handle_message")
+    parser.add_argument("--tracemalloc", action="store_true", help="mide el pico de memoria Python (más lento)")
+    parser.add_argument("--json", help="guarda el informe en este archivo")
+    args = parser.parse_args()
+
+    traccar = FakeTraccar(devices=args.devices, latency=args.traccar_latency).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(args, traccar.url, tmp)
+        agent_module = install_stubs(args, tmp)
+
+        with open(os.path.join(ROOT, "faq_trakii.json"), encoding="utf-8") as f:
+            questions = [item["question"] for item in json.load(f)]
+        messages = synthetic_messages(args.messages, args.users, args.devices, questions)
+
+        rss_before = rss_mb()
+        if args.tracemalloc:
+            tracemalloc.start()
+        results, elapsed = asyncio.run(replay(args, messages))
+        traced_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20 if args.tracemalloc else None
+
+        ok = [r for r in results if not r["failed"]]
+        report = {
+            "target": args.target,
+            "messages": len(results),
+            "failed": len(results) - len(ok),
+            "elapsed_s": round(elapsed, 2),
+            "offered_rate": args.rate,
+            "throughput_per_s": round(len(ok) / elapsed, 2),
+            "latency": summarize([r["latency"] for r in ok]),
+            "first_text": summarize([r["first_text"] for r in ok]),
+            "by_kind": {
+                kind: summarize([r["latency"] for r in ok if r["kind"] == kind]) for kind, _, _ in MIX
+            },
+            "memory": {
+                "rss_before_mb": round(rss_before, 1),
+                "rss_after_mb": round(rss_mb(), 1),
+                "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                "tracemalloc_peak_mb": round(traced_peak, 1) if traced_peak is not None else None,
+            },
+            "traccar_requests": dict(traccar.requests),
+            "answer_cache": agent_module.answer_cache.stats(),
+        }
+    traccar.stop()
+
+    print(f"Objetivo: {report['target']}  mensajes: {report['messages']}  fallidos: {report['failed']}  "
+          f"tiempo: {report['elapsed_s']}s")
+    print(f"Throughput: {report['throughput_per_s']} msg/s (ofrecido {args.rate} msg/s)")
+    for label, stats in [("Respuesta final", report["latency"]), ("Primer texto", report["first_text"])]:
+        print(f"{label:<16} p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  "
+              f"p99 {stats['p99_ms']:8.1f} ms  max {stats['max_ms']:8.1f} ms")
+    for kind, stats in report["by_kind"].items():
+        print(f"  {kind:<12} n={stats['count']:<5} p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms")
+    memory = report["memory"]
+    print(f"Memoria: RSS {memory['rss_before_mb']} -> {memory['rss_after_mb']} MB (máx {memory['max_rss_mb']} MB)"
+          + (f", pico tracemalloc {memory['tracemalloc_peak_mb']} MB" if memory["tracemalloc_peak_mb"] is not None else ""))
+    print(f"Traccar: {report['traccar_requests']}")
+    print(f"Caché de respuestas: {report['answer_cache']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark: informe de recorrido (/api/reports/route) con parseo en streaming y agregación NumPy.
+
+Compara, contra el Traccar falso de benchmarks/fakes.py:
+  - cargar la respuesta completa con .json() y sumar distancias en un bucle Python
+  - cargar la respuesta completa y agregar con NumPy
+  - parsear en streaming y agregar por bloques con NumPy (lo que usa el bot)
+
+Uso:
+    python benchmarks/bench_reports.py [--points 100000] [--devices 1]
+"""
+import argparse
+import math
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeTraccar  # noqa: E402
+
+import reports  # noqa: E402
+from traccar_client import TraccarClient  # noqa: E402
+
+
+def python_distance_km(positions: list) -> float:
+    total, last = 0.0, {}
+    for p in positions:
+        previous = last.get(p["deviceId"])
+        if previous is not None:
+            lat1, lon1, lat2, lon2 = map(math.radians, (previous[0], previous[1], p["latitude"], p["longitude"]))
+            a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+            total += 2 * reports.EARTH_RADIUS_M * math.asin(math.sqrt(a))
+        last[p["deviceId"]] = (p["latitude"], p["longitude"])
+    return round(total / 1000, 1)
+
+
+def measure(label: str, fn):
+    # Tiempo y memoria en pasadas separadas: tracemalloc ralentiza mucho el parseo
+    start = time.perf_counter()
+    distance = fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    print(f"{label:<36} {elapsed:7.2f}s  pico de memoria {peak:8.1f} MB  distancia {distance} km")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=100000, help="posiciones por dispositivo")
+    parser.add_argument("--devices", type=int, default=1)
+    args = parser.parse_args()
+
+    traccar = FakeTraccar(devices=args.devices, report_points=args.points).start()
+    client = TraccarClient(traccar.url, "bench", "bench")
+    device_ids = list(range(1, args.devices + 1))
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=7)
+    params = {"deviceId": device_ids, "from": start.strftime("%Y-%m-%dT%H:%M:%SZ"), "to": end.strftime("%Y-%m-%dT%H:%M:%SZ")}
+
+    def full_python():
+        return python_distance_km(client.get("/api/reports/route", params=params, timeout=(3, 120)).json())
+
+    def full_numpy():
+        positions = client.get("/api/reports/route", params=params, timeout=(3, 120)).json()
+        return round(sum(s.distance_m for s in reports.summarize_route(positions).values()) / 1000, 1)
+
+    def streaming_numpy():
+        summaries = reports.summarize_route(client.iter_report("route", device_ids, start, end))
+        return round(sum(s.distance_m for s in summaries.values()) / 1000, 1)
+
+    print(f"{args.points * args.devices} posiciones ({args.devices} dispositivos)")
+    measure("completa + bucle Python", full_python)
+    measure("completa + NumPy", full_numpy)
+    measure("streaming + NumPy por bloques", streaming_numpy)
+    client.close()
+    traccar.stop()
+
+
+if __name__ == "__main__":
+    main()
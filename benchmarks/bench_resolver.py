@@ -0,0 +1,83 @@
+"""Benchmark: resolución de dispositivos con el escaneo lineal original vs DeviceResolver.
+
+Uso:
+    python benchmarks/bench_resolver.py [--devices 10000] [--queries 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from device_resolver import DeviceResolver  # noqa: E402
+
+PREFIXES = ["Camión", "Moto", "Furgón", "Tractor", "Grúa", "Remolque", "Bus", "Pickup"]
+TEMPLATES = [
+    "¿Dónde está {name}?",
+    "velocidad de {name} por favor",
+    "estado del {name}",
+    "where is {name} right now",
+]
+
+
+def synthetic_fleet(n: int) -> list:
+    return [
+        {"id": i, "name": f"{PREFIXES[i % len(PREFIXES)]} {i}", "positionId": i * 10}
+        for i in range(1, n + 1)
+    ]
+
+
+def linear_scan(devices: list, message: str):
+    message = message.lower()
+    return next((d for d in devices if d["name"].lower() in message or str(d["id"]) in message), None)
+
+
+def linear_scan_best(devices: list, message: str):
+    # Lo mínimo para acertar sin índice: recorrer todo y quedarse con el nombre más largo
+    message = message.lower()
+    matches = [d for d in devices if d["name"].lower() in message]
+    return max(matches, key=lambda d: len(d["name"]), default=None)
+
+
+def bench(label: str, fn, queries: list) -> float:
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed * 1000:9.1f} ms total   {elapsed / len(queries) * 1e6:9.1f} µs/consulta")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=2_000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    devices = synthetic_fleet(args.devices)
+    expected = [rng.choice(devices) for _ in range(args.queries)]
+    queries = [rng.choice(TEMPLATES).format(name=d["name"]) for d in expected]
+
+    start = time.perf_counter()
+    resolver = DeviceResolver(devices)
+    print(f"Índice construido para {len(devices)} dispositivos en {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    bench("Escaneo lineal (original)", lambda q: linear_scan(devices, q), queries)
+    best = bench("Escaneo lineal completo", lambda q: linear_scan_best(devices, q), queries)
+    indexed = bench("DeviceResolver", resolver.resolve, queries)
+    print(f"Aceleración frente al escaneo completo: x{best / indexed:.1f}")
+
+    first_ok = sum(linear_scan(devices, q) is d for q, d in zip(queries, expected))
+    best_ok = sum(linear_scan_best(devices, q) is d for q, d in zip(queries, expected))
+    indexed_ok = sum(resolver.resolve(q) == [d] for q, d in zip(queries, expected))
+    print(
+        f"Aciertos exactos: original {first_ok}/{len(queries)} - "
+        f"completo {best_ok}/{len(queries)} - índice {indexed_ok}/{len(queries)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
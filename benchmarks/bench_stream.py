@@ -0,0 +1,111 @@
+"""Benchmark: stream de posiciones por WebSocket contra el Traccar falso de benchmarks/fakes.py.
+
+Mide, para una cuenta:
+  - lectura de la última posición desde la tabla del socket frente a una petición HTTP
+  - latencia de una actualización empujada por el servidor hasta la tabla
+  - reconexión tras un corte de la conexión (durante el corte no se sirven datos del socket)
+  - cierre del socket de una cuenta que deja de consultar (POSITION_STREAM_IDLE)
+
+Uso:
+    python benchmarks/bench_stream.py [--devices 500] [--reads 2000] [--traccar-latency 0.05]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeTraccar  # noqa: E402
+
+
+def wait_for(condition, timeout: float = 10.0) -> float:
+    """Segundos hasta que se cumple la condición (falla si no se cumple a tiempo)."""
+    started = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError("la condición no se cumplió a tiempo")
+        time.sleep(0.001)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--http-reads", type=int, default=50)
+    parser.add_argument("--pushes", type=int, default=200)
+    parser.add_argument("--traccar-latency", type=float, default=0.05)
+    parser.add_argument("--idle", type=float, default=1.0, help="POSITION_STREAM_IDLE en segundos")
+    args = parser.parse_args()
+
+    traccar = FakeTraccar(devices=args.devices, latency=args.traccar_latency).start()
+    os.environ.update({
+        "TRACCAR_URL": traccar.url,
+        "POSITION_STREAM_ENABLED": "true",
+        "POSITION_STREAM_IDLE": str(args.idle),
+        "POSITION_STREAM_MAX_BACKOFF": "2",
+    })
+    import position_stream
+    from traccar_client import get_client
+
+    client = get_client("cuenta0@bench", "bench")
+    stream = position_stream.get_stream(client)
+    connect_s = wait_for(lambda: stream.connected and len(stream.positions) == args.devices)
+
+    # === Lecturas: tabla del socket frente a HTTP ===
+    device = traccar.devices[0]
+    started = time.perf_counter()
+    for _ in range(args.reads):
+        assert device["id"] in stream.latest([device["id"]])
+    socket_us = (time.perf_counter() - started) / args.reads * 1e6
+    started = time.perf_counter()
+    for _ in range(args.http_reads):
+        client.get_positions([device["positionId"]])
+    http_ms = (time.perf_counter() - started) / args.http_reads * 1000
+
+    # === Actualizaciones empujadas por el servidor ===
+    push_ms = []
+    for i in range(args.pushes):
+        position = dict(traccar.positions[device["positionId"]], id=10 ** 7 + i)
+        traccar.broadcast({"positions": [position]})
+        push_ms.append(wait_for(lambda: stream.positions[device["id"]]["id"] == position["id"]) * 1000)
+    traccar.broadcast({"devices": [{"id": device["id"], "status": "offline", "lastUpdate": None}]})
+    wait_for(lambda: stream.statuses([device["id"]]).get(device["id"]) == "offline")
+
+    # === Reconexión tras un corte ===
+    traccar.drop_sockets()
+    wait_for(lambda: not stream.connected)
+    served_while_down = bool(stream.latest([device["id"]]))
+    reconnect_s = wait_for(lambda: stream.connected and len(traccar.sockets) == 1)
+    socket_requests = traccar.requests["GET /api/socket"]
+
+    # === Cierre por inactividad ===
+    # Otra cuenta consulta; la primera lleva más de POSITION_STREAM_IDLE sin hacerlo
+    time.sleep(args.idle * 1.5)
+    other = position_stream.get_stream(get_client("cuenta1@bench", "bench"))
+    idle_close_s = wait_for(lambda: traccar.socket_closes["client"] == 1 and other.connected)
+    # El hilo del stream cerrado termina en lugar de reconectar
+    wait_for(lambda: not stream._thread.is_alive())
+
+    position_stream.stop_all()
+    wait_for(lambda: not traccar.sockets)
+    traccar.stop()
+
+    push_ms.sort()
+    print(f"{args.devices} dispositivos, latencia de Traccar {args.traccar_latency * 1000:.0f} ms")
+    print(f"Conexión y tabla inicial: {connect_s * 1000:.1f} ms")
+    print(f"Última posición: socket {socket_us:.1f} µs, HTTP {http_ms:.1f} ms por lectura")
+    print(f"Actualización empujada: p50 {statistics.median(push_ms):.2f} ms, "
+          f"p95 {push_ms[int(len(push_ms) * 0.95) - 1]:.2f} ms ({args.pushes} envíos)")
+    print(f"Reconexión tras corte: {reconnect_s * 1000:.0f} ms "
+          f"(datos del socket durante el corte: {'sí' if served_while_down else 'no'}, conexiones: {socket_requests})")
+    print(f"Cierre por inactividad: {idle_close_s * 1000:.0f} ms tras la consulta de otra cuenta "
+          f"(cierres: {dict(traccar.socket_closes)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+"""Dobles locales para benchmarks: servidor Traccar falso, LLM y embeddings deterministas
+y objetos mínimos de Telegram. Ningún componente hace llamadas externas."""
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import socket
+import struct
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+from fast_triage import score
+
+SESSION_COOKIE = "JSESSIONID=bench"
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+# === 🛰️ Traccar falso ===
+def make_fleet(devices: int, seed: int = 7) -> tuple:
+    """(dispositivos, posiciones por id) con nombres y coordenadas reproducibles."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    fleet, positions = [], {}
+    for i in range(1, devices + 1):
+        position_id = 100000 + i
+        fleet.append({"id": i, "name": f"Camion {i}", "uniqueId": f"IMEI{i:08d}", "status": "online",
+                      "positionId": position_id})
+        positions[position_id] = {
+            "id": position_id,
+            "deviceId": i,
+            "latitude": round(rng.uniform(-34.0, -33.0), 6),
+            "longitude": round(rng.uniform(-71.0, -70.0), 6),
+            "speed": round(rng.uniform(0, 60), 1),
+            "fixTime": (now - timedelta(seconds=rng.randint(0, 600))).isoformat(),
+            "attributes": {"batteryLevel": rng.randint(5, 100), "motion": rng.random() < 0.5,
+                           "totalDistance": rng.randint(0, 10 ** 7)},
+        }
+    return fleet, positions
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="milliseconds")
+
+
+def _report_range(query: dict) -> tuple:
+    parse = lambda v: datetime.fromisoformat(v.replace("Z", "+00:00")).timestamp()  # noqa: E731
+    return [int(i) for i in query.get("deviceId", [])], parse(query["from"][0]), parse(query["to"][0])
+
+
+def _ws_frame(opcode: int, payload: bytes) -> bytes:
+    # Trama final sin máscara (servidor -> cliente)
+    size = len(payload)
+    if size < 126:
+        header = struct.pack("!BB", 0x80 | opcode, size)
+    elif size < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, size)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, size)
+    return header + payload
+
+
+def _ws_read(rfile):
+    """(opcode, payload) de la siguiente trama del cliente, o None si cerró la conexión."""
+    head = rfile.read(2)
+    if len(head) < 2:
+        return None
+    opcode, size = head[0] & 0x0F, head[1] & 0x7F
+    if size == 126:
+        size = struct.unpack("!H", rfile.read(2))[0]
+    elif size == 127:
+        size = struct.unpack("!Q", rfile.read(8))[0]
+    mask = rfile.read(4) if head[1] & 0x80 else b""
+    payload = rfile.read(size)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+class FakeSocketClient:
+    """Conexión abierta a /api/socket del Traccar falso."""
+
+    def __init__(self, connection, wfile):
+        self.connection = connection
+        self.wfile = wfile
+        self._lock = threading.Lock()
+
+    def send(self, payload: dict):
+        self.send_frame(0x1, json.dumps(payload).encode("utf-8"))
+
+    def send_frame(self, opcode: int, payload: bytes = b""):
+        with self._lock:
+            self.wfile.write(_ws_frame(opcode, payload))
+            self.wfile.flush()
+
+    def drop(self):
+        # Corte abrupto (sin trama de cierre), como una caída de red o un reinicio de Traccar
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class FakeTraccar:
+    """API REST mínima de Traccar con latencia inyectable.
+
+    Sirve /api/session, /api/devices, /api/positions, /api/geofences y /api/reports/{route,trips,stops}.
+    Los informes se generan al vuelo y se envían con Transfer-Encoding: chunked,
+    con `report_points` posiciones por dispositivo en el periodo pedido.
+
+    /api/socket acepta WebSocket: al conectar envía el estado y la última posición
+    de todos los dispositivos; `broadcast` empuja actualizaciones a los clientes
+    conectados y `drop_sockets` corta las conexiones para probar la reconexión.
+    """
+
+    def __init__(self, devices: int = 50, latency: float = 0.0, report_points: int = 1000,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.devices, self.positions = make_fleet(devices)
+        self.geofences = []
+        self.latency = latency
+        self.report_points = report_points
+        self.requests = Counter()
+        self.routes = {
+            "/api/devices": self._devices,
+            "/api/positions": self._positions,
+            "/api/geofences": self._geofences,
+            "/api/reports/route": self._route,
+            "/api/reports/trips": self._trips,
+            "/api/reports/stops": self._stops,
+        }
+        self.sockets: set = set()
+        self.socket_closes = Counter()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="fake-traccar", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.drop_sockets()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def broadcast(self, payload: dict):
+        for client in list(self.sockets):
+            try:
+                client.send(payload)
+            except OSError:
+                pass
+
+    def drop_sockets(self) -> int:
+        clients = list(self.sockets)
+        for client in clients:
+            client.drop()
+        return len(clients)
+
+    def _devices(self, query: dict):
+        return self.devices
+
+    def _positions(self, query: dict):
+        ids = [int(i) for i in query.get("id", [])]
+        if not ids:
+            return list(self.positions.values())
+        return [self.positions[i] for i in ids if i in self.positions]
+
+    def _geofences(self, query: dict):
+        return self.geofences
+
+    def _route(self, query: dict):
+        # Recorrido aleatorio: 10 min en marcha, 5 detenido, y vuelta a empezar
+        device_ids, start, end = _report_range(query)
+        step = (end - start) / max(1, self.report_points)
+        for device_id in device_ids:
+            rng = random.Random(device_id)
+            lat, lon = -33.45 + rng.uniform(-0.1, 0.1), -70.65 + rng.uniform(-0.1, 0.1)
+            for i in range(self.report_points):
+                ts = start + i * step
+                moving = (ts // 60) % 15 < 10
+                speed = rng.uniform(10, 50) if moving else 0.0
+                if moving:
+                    lat += rng.uniform(-1, 1) * speed * step * 1e-7
+                    lon += rng.uniform(-1, 1) * speed * step * 1e-7
+                yield {"id": i, "deviceId": device_id, "valid": True, "fixTime": _iso(ts),
+                       "latitude": round(lat, 6), "longitude": round(lon, 6), "speed": round(speed, 1),
+                       "attributes": {"motion": moving}}
+
+    def _events(self, query: dict, kind: str):
+        device_ids, start, end = _report_range(query)
+        for device_id in device_ids:
+            ts = start
+            while ts + 900 <= end:
+                item = {"deviceId": device_id, "deviceName": f"Camion {device_id}",
+                        "startTime": _iso(ts), "endTime": _iso(ts + 600 if kind == "trips" else ts + 300)}
+                if kind == "trips":
+                    item.update({"distance": 4500.0, "duration": 600000, "maxSpeed": 27.0, "averageSpeed": 14.6})
+                else:
+                    item.update({"duration": 300000, "latitude": -33.45, "longitude": -70.65, "address": None})
+                yield item
+                ts += 900
+
+    def _trips(self, query: dict):
+        return self._events(query, "trips")
+
+    def _stops(self, query: dict):
+        return self._events(query, "stops")
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, code: int, body=None, headers: dict = None):
+                data = json.dumps(body if body is not None else {}).encode("utf-8")
+                self.send_response(code)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                server.requests["POST /api/session"] += 1
+                self._send(200, {"id": 1}, {"Set-Cookie": f"{SESSION_COOKIE}; Path=/"})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                server.requests[f"GET {url.path}"] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                if SESSION_COOKIE not in (self.headers.get("Cookie") or ""):
+                    return self._send(401)
+                if url.path == "/api/socket":
+                    return self._websocket()
+                route = server.routes.get(url.path)
+                if route is None:
+                    return self._send(404)
+                body = route(parse_qs(url.query))
+                if isinstance(body, list):
+                    return self._send(200, body)
+                self._send_chunked(body)
+
+            def _websocket(self):
+                key = self.headers.get("Sec-WebSocket-Key", "")
+                accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest())
+                self.send_response(101)
+                self.send_header("Upgrade", "websocket")
+                self.send_header("Connection", "Upgrade")
+                self.send_header("Sec-WebSocket-Accept", accept.decode("ascii"))
+                self.end_headers()
+                self.wfile.flush()
+                self.close_connection = True
+
+                client = FakeSocketClient(self.connection, self.wfile)
+                server.sockets.add(client)
+                reason = "dropped"
+                try:
+                    client.send({
+                        "devices": [{"id": d["id"], "status": d["status"], "lastUpdate": _iso(time.time())}
+                                    for d in server.devices],
+                        "positions": list(server.positions.values()),
+                    })
+                    while True:
+                        frame = _ws_read(self.rfile)
+                        if frame is None:
+                            break
+                        opcode, payload = frame
+                        if opcode == 0x8:
+                            # Cierre pedido por el cliente (p. ej. stream inactivo): se responde y se termina
+                            reason = "client"
+                            client.send_frame(0x8, payload[:2])
+                            break
+                        if opcode == 0x9:
+                            client.send_frame(0xA, payload)
+                except OSError:
+                    pass
+                finally:
+                    server.sockets.discard(client)
+                    server.socket_closes[reason] += 1
+
+            def _send_chunked(self, items):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                batch, first = ["["], True
+                for item in items:
+                    batch.append(("" if first else ",") + json.dumps(item))
+                    first = False
+                    if len(batch) >= 500:
+                        self._write_chunk("".join(batch))
+                        batch = []
+                batch.append("]")
+                self._write_chunk("".join(batch))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, text: str):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+# === 🤖 LLM y embeddings deterministas ===
+STUB_ANSWER = (
+    "TrakiiBot es un asistente de rastreo GPS que responde por Telegram sobre la ubicación, "
+    "la velocidad y el estado de tus dispositivos, y resuelve dudas frecuentes sobre la plataforma."
+)
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model con latencia fija: responde STUB_ANSWER (en streaming, palabra a palabra)."""
+
+    latency: float = 0.2
+    token_interval: float = 0.01
+    answer: str = STUB_ANSWER
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for word in self.answer.split(" "):
+            time.sleep(self.token_interval)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+    def with_structured_output(self, schema, **kwargs):
+        # Router: la mejor intención según el léxico del fast-path, o "ask"
+        def route(messages):
+            time.sleep(self.latency)
+            text = messages[-1]["content"] if isinstance(messages[-1], dict) else messages[-1].content
+            scores = score(text)
+            best = max(scores, key=scores.get) if scores and max(scores.values()) > 0 else "ask"
+            return schema(reasoning="stub", classification=best)
+
+        return RunnableLambda(route)
+
+
+class StubEmbeddings(DeterministicFakeEmbedding):
+    """Embeddings deterministas (hash del texto) con latencia por llamada."""
+
+    latency: float = 0.0
+
+    def embed_documents(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        return super().embed_query(text)
+
+
+# === 💬 Telegram mínimo (lo que usa handle_message) ===
+class FakeSentMessage:
+    def __init__(self, chat: "FakeMessage"):
+        self.chat = chat
+
+    async def edit_text(self, text: str, parse_mode: str = None):
+        if self.chat.api_latency:
+            await asyncio.sleep(self.chat.api_latency)
+        self.chat.record("edit", text)
+
+
+class FakeMessage:
+    """Message de PTB con reply_text / reply_chat_action; registra cuándo se ve el primer y el último texto."""
+
+    def __init__(self, text: str, api_latency: float = 0.0):
+        self.text = text
+        self.api_latency = api_latency
+        self.created_at = time.perf_counter()
+        self.first_text_at = None
+        self.last_text_at = None
+        self.replies = []
+
+    def record(self, kind: str, text: str):
+        now = time.perf_counter()
+        if self.first_text_at is None:
+            self.first_text_at = now
+        self.last_text_at = now
+        self.replies.append((kind, text))
+
+    async def reply_text(self, text: str, parse_mode: str = None):
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+        self.record("send", text)
+        return FakeSentMessage(self)
+
+    async def reply_chat_action(self, action):
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+
+class FakeUpdate:
+    def __init__(self, user_id: int, text: str, api_latency: float = 0.0):
+        self.effective_user = FakeUser(user_id)
+        self.message = FakeMessage(text, api_latency)
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from device_resolver import DeviceResolver
+from log_config import bot_logger, error_logger
+
+# === Configuración del caché de dispositivos ===
+DEVICE_CACHE_TTL = float(os.getenv("DEVICE_CACHE_TTL", "300"))           # segundos en los que la lista es "fresca"
+DEVICE_CACHE_MAX_STALE = float(os.getenv("DEVICE_CACHE_MAX_STALE", "3600"))  # hasta cuándo se sirve una lista vieja mientras se refresca
+DEVICE_CACHE_MAX_ACCOUNTS = int(os.getenv("DEVICE_CACHE_MAX_ACCOUNTS", "256"))
+
+
+class _Entry:
+    __slots__ = ("resolver", "fetched_at", "refreshing", "lock")
+
+    def __init__(self):
+        # El resolver guarda la lista y su índice: se reemplaza de una vez al refrescar
+        self.resolver = None
+        self.fetched_at = 0.0
+        self.refreshing = False
+        self.lock = threading.Lock()
+
+
+class DeviceCache:
+    """Caché de `/api/devices` por cuenta Traccar.
+
+    - TTL: dentro de `ttl` se responde sin ir a Traccar.
+    - Stale-while-revalidate: entre `ttl` y `max_stale` se devuelve la lista
+      anterior y se refresca en segundo plano.
+    - LRU entre cuentas, limitado a `max_accounts`.
+    """
+
+    def __init__(self, ttl: float = DEVICE_CACHE_TTL, max_stale: float = DEVICE_CACHE_MAX_STALE,
+                 max_accounts: int = DEVICE_CACHE_MAX_ACCOUNTS):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_accounts = max_accounts
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(client) -> tuple:
+        return (client.base_url, client.username)
+
+    def _entry(self, key) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry()
+                self._entries[key] = entry
+                while len(self._entries) > self.max_accounts:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            return entry
+
+    def get(self, client) -> list:
+        return self.resolver(client).devices
+
+    def resolver(self, client) -> DeviceResolver:
+        key = self._key(client)
+        entry = self._entry(key)
+        age = time.monotonic() - entry.fetched_at
+
+        if entry.resolver is not None and age < self.ttl:
+            self.hits += 1
+            return entry.resolver
+
+        if entry.resolver is not None and age < self.max_stale:
+            self.hits += 1
+            self._refresh_in_background(client, entry)
+            return entry.resolver
+
+        # Sin datos (o demasiado viejos): descarga síncrona, una sola por cuenta
+        with entry.lock:
+            if entry.resolver is None or time.monotonic() - entry.fetched_at >= self.ttl:
+                self.misses += 1
+                self._load(client, entry)
+        return entry.resolver
+
+    def _load(self, client, entry: _Entry):
+        devices = client.get_devices()
+        entry.resolver = DeviceResolver(devices)
+        entry.fetched_at = time.monotonic()
+        bot_logger.info(f"[DEVICES] Catálogo cargado para {client.username}: {len(devices)} dispositivos")
+
+    def _refresh_in_background(self, client, entry: _Entry):
+        with self._lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+
+        def refresh():
+            try:
+                with entry.lock:
+                    self._load(client, entry)
+            except Exception as e:
+                error_logger.error(f"[DEVICES] Error refrescando catálogo de {client.username}: {e}")
+            finally:
+                entry.refreshing = False
+
+        threading.Thread(target=refresh, name="trakii-device-refresh", daemon=True).start()
+
+    def invalidate(self, client=None):
+        """Descarta el catálogo de una cuenta (o de todas si `client` es None)."""
+        with self._lock:
+            if client is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self._key(client), None)
+
+
+# Instancia compartida por todos los handlers
+device_cache = DeviceCache()
@@ -0,0 +1,133 @@
+import re
+import unicodedata
+from collections import deque
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+# ID explícito: "id 7", "id: 7", "#7"
+ID_PATTERN = re.compile(r"(?:#\s*|\bid\b\W*)(\d+)\b", re.IGNORECASE)
+
+
+def fold(text: str) -> str:
+    """Minúsculas y sin acentos, conservando la puntuación ("72,5 km/h")."""
+    text = unicodedata.normalize("NFKD", str(text))
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sin acentos y con separadores colapsados a un espacio."""
+    return _NON_ALNUM.sub(" ", fold(text)).strip()
+
+
+def name_pattern(name: str) -> re.Pattern:
+    """Regex del nombre de un dispositivo sobre texto `fold`: palabras completas y cualquier separador."""
+    words = normalize(name).split()
+    return re.compile(r"(?<![a-z0-9])" + r"[^a-z0-9]+".join(map(re.escape, words)) + r"(?![a-z0-9])")
+
+
+class DeviceResolver:
+    """Índice de nombres de dispositivos para resolver menciones en O(len(mensaje)).
+
+    Usa un autómata Aho-Corasick sobre los nombres normalizados (delimitados
+    por espacios, para casar solo palabras completas) y un mapa exacto de IDs.
+    """
+
+    def __init__(self, devices: list):
+        self.devices = devices
+        self._by_id = {str(d["id"]): d for d in devices}
+
+        # Trie: lista de nodos {char: hijo}, con enlaces de fallo y salidas
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]  # por nodo: [(longitud_patrón, [dispositivos])]
+        patterns: dict = {}
+        for d in devices:
+            name = normalize(d.get("name", ""))
+            if name:
+                patterns.setdefault(f" {name} ", []).append(d)
+        for pattern, matched in patterns.items():
+            self._add(pattern, matched)
+        self._build()
+
+    def _add(self, pattern: str, matched: list):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(pattern), matched))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _name_matches(self, text: str) -> list:
+        """Devuelve [(inicio, fin, [dispositivos])] de todos los nombres presentes."""
+        matches = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, matched in self._out[node]:
+                matches.append((i - length + 1, i + 1, matched))
+        return matches
+
+    def resolve(self, message: str) -> list:
+        """Dispositivos mencionados en el mensaje.
+
+        Se prefieren las coincidencias más largas: "camion 12" gana a "camion".
+        Un ID solo cuenta con marcador explícito ("id 7", "#7") fuera de un nombre,
+        para que "últimas 24 horas" o "a 80 km/h" no se lean como dispositivos.
+        Si varios dispositivos comparten nombre se devuelven todos (ambiguo).
+        """
+        text = f" {normalize(message)} "
+        matches = self._name_matches(text)
+
+        # Descarta coincidencias contenidas en otra más larga
+        matches.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+        selected = []
+        covered_until = -1
+        for start, end, matched in matches:
+            if end <= covered_until:
+                continue
+            selected.append((start, end, matched))
+            covered_until = max(covered_until, end)
+
+        result = []
+        seen = set()
+        for _, _, matched in selected:
+            for d in matched:
+                if d["id"] not in seen:
+                    seen.add(d["id"])
+                    result.append(d)
+
+        # IDs numéricos con marcador, fuera de los nombres ya reconocidos ("unidad #3" es un nombre)
+        for token in ID_PATTERN.finditer(message):
+            # Posición del número en el texto normalizado (normalizar un prefijo da el prefijo normalizado)
+            end = 1 + len(normalize(message[:token.end()]))
+            start = end - len(token.group(1))
+            if any(s <= start and end <= e for s, e, _ in selected):
+                continue
+            d = self._by_id.get(token.group(1))
+            if d is not None and d["id"] not in seen:
+                seen.add(d["id"])
+                result.append(d)
+
+        return result
+
+    def by_ids(self, ids) -> list:
+        """Dispositivos con esos IDs que siguen existiendo en la cuenta (en el mismo orden)."""
+        return [self._by_id[str(i)] for i in ids if str(i) in self._by_id]
@@ -0,0 +1,152 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# === Configuración de embeddings ===
+# openai (por defecto) o local (sentence-transformers en CPU)
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "openai").lower()
+OPENAI_EMBEDDINGS_MODEL = os.getenv("OPENAI_EMBEDDINGS_MODEL", "text-embedding-ada-002")
+LOCAL_EMBEDDINGS_MODEL = os.getenv(
+    "LOCAL_EMBEDDINGS_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+)
+# Caché persistente de los documentos indexados, direccionado por contenido ("" lo desactiva).
+# Las consultas de los usuarios solo se guardan en el LRU en memoria (EMBEDDINGS_MEMORY_CACHE)
+EMBEDDINGS_CACHE_DB = os.getenv("EMBEDDINGS_CACHE_DB", "state/embeddings.db")
+EMBEDDINGS_MEMORY_CACHE = int(os.getenv("EMBEDDINGS_MEMORY_CACHE", "2048"))
+
+
+class LocalEmbeddings(Embeddings):
+    """Modelo sentence-transformers en CPU (opcional: pip install sentence-transformers)."""
+
+    def __init__(self, model_name: str = LOCAL_EMBEDDINGS_MODEL):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def embed_documents(self, texts: list) -> list:
+        return self.model.encode(texts, normalize_embeddings=True, batch_size=32).tolist()
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Envuelve un backend con caché en memoria (LRU) y en disco (SQLite).
+
+    La clave es sha256(modelo + texto). Los documentos (embed_documents) se guardan
+    en disco y no se vuelven a calcular ni entre reinicios ni entre procesos; las
+    consultas (embed_query) solo van al LRU en memoria, para que cada pregunta
+    distinta de los usuarios no haga crecer la tabla sin límite.
+    """
+
+    def __init__(self, backend: Embeddings, namespace: str, path: str = EMBEDDINGS_CACHE_DB,
+                 memory_size: int = EMBEDDINGS_MEMORY_CACHE):
+        self.backend = backend
+        self.namespace = namespace
+        self.path = path
+        self.memory_size = memory_size
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._dims = None
+        self.hits = 0
+        self.misses = 0
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connect().execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\n{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, keys: list) -> dict:
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+        missing = [k for k in keys if k not in found]
+        if missing and self.path:
+            for i in range(0, len(missing), 500):
+                part = missing[i:i + 500]
+                rows = self._connect().execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                    found[key] = vector
+                    self._remember(key, vector)
+        return found
+
+    def embed_documents(self, texts: list) -> list:
+        return self._embed(texts, persist=True)
+
+    def _embed(self, texts: list, persist: bool) -> list:
+        keys = [self._key(t) for t in texts]
+        found = self._lookup(keys)
+        # Un solo lote al backend con los textos que faltan (sin repetir)
+        pending = list(OrderedDict((k, t) for k, t in zip(keys, texts) if k not in found).items())
+        self.hits += len(texts) - len(pending)
+        self.misses += len(pending)
+        if pending:
+            vectors = self.backend.embed_documents([t for _, t in pending])
+            rows = []
+            for (key, _), vector in zip(pending, vectors):
+                found[key] = vector
+                self._remember(key, vector)
+                rows.append((key, np.asarray(vector, dtype=np.float32).tobytes()))
+            if self.path and persist:
+                self._connect().executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> list:
+        return self._embed([text], persist=False)[0]
+
+    @property
+    def dims(self) -> int:
+        if self._dims is None:
+            self._dims = len(self.embed_query("dimension probe"))
+        return self._dims
+
+
+def create_backend(backend: str = EMBEDDINGS_BACKEND):
+    """(embeddings, id del modelo) según EMBEDDINGS_BACKEND."""
+    if backend == "local":
+        return LocalEmbeddings(), f"local:{LOCAL_EMBEDDINGS_MODEL}"
+    from langchain_openai import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(model=OPENAI_EMBEDDINGS_MODEL), f"openai:{OPENAI_EMBEDDINGS_MODEL}"
+
+
+def get_embedding_function(backend: str = EMBEDDINGS_BACKEND) -> CachedEmbeddings:
+    embeddings, model_id = create_backend(backend)
+    return CachedEmbeddings(embeddings, namespace=model_id)
+
+
+def collection_name(backend: str = EMBEDDINGS_BACKEND) -> str:
+    # Cada backend tiene su propia colección en knowledge_db (las dimensiones no coinciden)
+    return "langchain" if backend == "openai" else f"trakii_{backend}"
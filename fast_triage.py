@@ -0,0 +1,163 @@
+import os
+import re
+import threading
+from typing import NamedTuple, Optional
+
+from device_resolver import normalize
+
+# === Configuración ===
+# Confianza mínima para saltarse el router LLM
+FAST_TRIAGE_THRESHOLD = float(os.getenv("FAST_TRIAGE_THRESHOLD", "0.8"))
+FAST_TRIAGE_ENABLED = os.getenv("FAST_TRIAGE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Mensajes largos suelen mezclar intenciones: se penaliza su confianza
+LONG_MESSAGE_WORDS = 14
+
+# === Léxico (español e inglés) sobre texto normalizado: minúsculas y sin acentos ===
+# Cada intención tiene patrones fuertes (confianza alta) y débiles.
+LEXICON = {
+    "list": {
+        "strong": [
+            r"^list(a|ar|ado)?$",
+            r"^list(a|ar|ado)? (de )?(mis |los |todos los )?(dispositivos|equipos|unidades|gps|rastreadores)",
+            r"\b(list|show|see) (all |my )?(devices|trackers|units)\b",
+            r"\b(ver|mostrar|muestrame|dame) (mis |los |todos los )?(dispositivos|equipos|unidades|rastreadores)\b",
+            r"\bcuantos (dispositivos|equipos|gps|rastreadores) tengo\b",
+        ],
+        "weak": [r"\bmis dispositivos\b", r"\bmy devices\b"],
+    },
+    "location": {
+        "strong": [
+            r"\b(donde|adonde) (esta|se encuentra|anda|queda)\b",
+            r"\bubica(cion|r|me)?\b",
+            r"\blocaliza(r|cion)?\b",
+            r"\bwhere (is|s)\b",
+            r"\b(location|locate|coordinates|coordenadas)\b",
+        ],
+        "weak": [r"\bposicion\b", r"\bposition\b", r"\bmapa\b", r"\bmap\b"],
+    },
+    "speed": {
+        "strong": [
+            r"\bvelocidad\b",
+            r"\b(que|cuan) (tan )?rapido\b",
+            r"\ba que velocidad\b",
+            r"\bspeed\b",
+            r"\bhow fast\b",
+        ],
+        "weak": [r"\bkm ?h\b", r"\bkph\b", r"\bmph\b"],
+    },
+    "status": {
+        "strong": [
+            r"\bestado\b",
+            r"\bbateria\b",
+            r"\bbattery\b",
+            r"\bstatus\b",
+            r"\bultima (conexion|actualizacion|reporte|vez)\b",
+            r"\blast (seen|report|update)\b",
+        ],
+        "weak": [r"\b(en linea|online|offline|conectado|desconectado)\b", r"\bvoltaje\b"],
+    },
+    "route": {
+        "strong": [
+            r"\brecorri(o|do|dos|da|eron)\b",
+            r"\b(cuantos|cuantas) (km|kms|kilometros|millas)\b",
+            r"\b(ruta|historial|gpx)\b",
+            r"\b(velocidad maxima|max speed|maximum speed)\b",
+            r"\b(route|history|distance traveled|mileage|how many (km|miles))\b",
+        ],
+        "weak": [r"\bdistancia\b", r"\bdistance\b", r"\bkilometraje\b"],
+    },
+    "trips": {
+        "strong": [r"\bviajes?\b", r"\btrayectos?\b", r"\btrips?\b"],
+        "weak": [r"\bsalidas?\b"],
+    },
+    "stops": {
+        "strong": [r"\bparadas?\b", r"\bdetenciones\b", r"\bse (detuvo|paro|estaciono)\b", r"\bstops?\b"],
+        "weak": [r"\b(estacionad[oa]|parked)\b"],
+    },
+}
+
+# Preguntas de uso o sobre el producto ("¿cuánto dura la batería del miniGPS?",
+# "¿cómo cambio la velocidad máxima?"): comparten palabras con las consultas de
+# dispositivos, pero las responde handle_ask; se dejan al LLM.
+FAQ_PATTERNS = [
+    r"\bcuant[oa]s? (dura|duran|tarda|tardan|cuesta|cuestan|vale|valen)\b",
+    r"\bcomo (se|puedo|podemos|hago|hacer|funciona|funcionan|configuro|cambio|activo|desactivo|instalo|cargo|veo)\b",
+    r"\bque (es|son|significa|quiere decir)\b",
+    r"\bpara que sirve\b",
+    r"\bse puede\b",
+    r"\bhow (do|does|can|to|long|much)\b",
+    r"\bwhat (is an?|are|does)\b",
+]
+
+STRONG_CONFIDENCE = 0.95
+WEAK_CONFIDENCE = 0.7
+
+_COMPILED = {
+    intent: {kind: [re.compile(p) for p in patterns] for kind, patterns in groups.items()}
+    for intent, groups in LEXICON.items()
+}
+_FAQ = [re.compile(p) for p in FAQ_PATTERNS]
+
+
+class FastTriage(NamedTuple):
+    classification: str
+    confidence: float
+
+
+def score(message: str) -> dict:
+    """Confianza por intención según el léxico (0 si no hay coincidencias)."""
+    text = normalize(message)
+    scores = {}
+    for intent, groups in _COMPILED.items():
+        if any(p.search(text) for p in groups["strong"]):
+            scores[intent] = STRONG_CONFIDENCE
+        elif any(p.search(text) for p in groups["weak"]):
+            scores[intent] = WEAK_CONFIDENCE
+    if len(text.split()) > LONG_MESSAGE_WORDS:
+        scores = {intent: s - 0.2 for intent, s in scores.items()}
+    return scores
+
+
+def classify(message: str, threshold: float = FAST_TRIAGE_THRESHOLD) -> Optional[FastTriage]:
+    """Clasificación local; None si el mensaje es ambiguo y debe ir al LLM."""
+    if not FAST_TRIAGE_ENABLED:
+        return None
+    if any(p.search(normalize(message)) for p in _FAQ):
+        return None
+    scores = score(message)
+    if not scores:
+        return None
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    intent, confidence = ranked[0]
+    # Dos intenciones con la misma fuerza: que decida el LLM
+    if len(ranked) > 1 and ranked[1][1] >= confidence:
+        return None
+    if confidence < threshold:
+        return None
+    return FastTriage(intent, confidence)
+
+
+# === 📊 Contadores fast-path vs LLM ===
+class TriageStats:
+    def __init__(self):
+        self.fast = 0
+        self.llm = 0
+        self._lock = threading.Lock()
+
+    def record(self, fast_path: bool):
+        with self._lock:
+            if fast_path:
+                self.fast += 1
+            else:
+                self.llm += 1
+
+    @property
+    def fast_rate(self) -> float:
+        total = self.fast + self.llm
+        return self.fast / total if total else 0.0
+
+    def as_dict(self) -> dict:
+        return {"fast": self.fast, "llm": self.llm, "fast_rate": round(self.fast_rate, 3)}
+
+
+triage_stats = TriageStats()
@@ -1,16 +1,186 @@
-from langchain.document_loaders import JSONLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import Chroma
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 from dotenv import load_dotenv
+from answer_cache import KNOWLEDGE_DB, mark_knowledge_updated
+from embeddings import collection_name, get_embedding_function
 load_dotenv()
-# Carga tu FAQ
-loader = JSONLoader(file_path="faq_trakii.json", jq_schema=".[].answer")
-docs = loader.load()
-splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-chunks = splitter.split_documents(docs)
-
-# Indexa y persiste
-vectordb = Chroma.from_documents(chunks, OpenAIEmbeddings(), persist_directory="knowledge_db")
-vectordb.persist()
-print("✅ Indexación completada")
+
+# === Configuración ===
+# Las rutas de las fuentes se guardan (y forman parte del id) relativas a la raíz del repo
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCES = ["faq_trakii.json", "knowledge"]   # archivos o carpetas (.json, .md, .txt, .pdf)
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH", "64"))
+# Tamaño aproximado de los bloques que se leen de un .md/.txt antes de fragmentarlos
+TEXT_BLOCK_CHARS = 20 * CHUNK_SIZE
+
+splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+# === 📥 Loaders en streaming: producen (texto, metadata) bloque a bloque ===
+def load_json(path: str):
+    # FAQ: lista de {"question", "answer"}; se indexa la respuesta
+    with open(path, encoding="utf-8") as f:
+        for i, item in enumerate(json.load(f)):
+            yield item["answer"], {"source": path, "seq_num": i + 1}
+
+
+def load_text(path: str):
+    # Lee línea a línea y corta en encabezados Markdown o al llegar a TEXT_BLOCK_CHARS
+    block, size = [], 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if (line.startswith("#") and block) or size >= TEXT_BLOCK_CHARS:
+                yield "".join(block), {"source": path}
+                block, size = [], 0
+            block.append(line)
+            size += len(line)
+    if block:
+        yield "".join(block), {"source": path}
+
+
+def load_pdf(path: str):
+    from pypdf import PdfReader  # opcional: pip install pypdf
+
+    reader = PdfReader(path)
+    for number, page in enumerate(reader.pages, start=1):
+        text = page.extract_text() or ""
+        if text.strip():
+            yield text, {"source": path, "page": number}
+
+
+LOADERS = {".json": load_json, ".md": load_text, ".txt": load_text, ".pdf": load_pdf}
+
+
+def iter_files(sources: list):
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, files in os.walk(source):
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in LOADERS:
+                        yield os.path.join(root, name)
+        elif os.path.exists(source):
+            yield source
+
+
+def canonical_path(path: str, base: str = None) -> str:
+    """Ruta relativa a la raíz del repo (absoluta si queda fuera), con "/" como separador.
+
+    No depende de si el archivo se indica como ruta relativa, absoluta o desde otro
+    directorio, así que el id de cada fragmento no cambia entre ejecuciones.
+    """
+    path = os.path.abspath(os.path.join(base or os.getcwd(), path))
+    try:
+        relative = os.path.relpath(path, ROOT)
+    except ValueError:  # otra unidad en Windows
+        return path.replace(os.sep, "/")
+    if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+        return path.replace(os.sep, "/")
+    return relative.replace(os.sep, "/")
+
+
+def iter_chunks(sources: list):
+    """(id, texto, metadata) de cada fragmento; el id depende solo de la fuente y el contenido."""
+    for file_path in iter_files(sources):
+        loader = LOADERS[os.path.splitext(file_path)[1].lower()]
+        path = canonical_path(file_path)
+        occurrences: dict = {}
+        for text, metadata in loader(file_path):
+            for chunk in splitter.split_text(text):
+                digest = hashlib.sha256(f"{path}\n{chunk}".encode("utf-8")).hexdigest()
+                # Un mismo texto repetido en el archivo recibe ids distintos y estables
+                occurrence = occurrences.get(digest, 0)
+                occurrences[digest] = occurrence + 1
+                chunk_id = f"{digest[:40]}-{occurrence}"
+                yield chunk_id, chunk, {**metadata, "source": path, "content_hash": digest}
+
+
+# === 🔁 Sincronización incremental ===
+def in_sources(path: str, sources: list) -> bool:
+    """True si el archivo guardado (ruta canónica) es una de las fuentes o está dentro de una carpeta fuente.
+
+    `path` es relativo a la raíz del repo; las bases creadas por la versión anterior
+    de este script guardan rutas absolutas, que también se reconocen.
+    """
+    path = canonical_path(path, ROOT)
+    for source in sources:
+        source = canonical_path(source)
+        if path == source or path.startswith(source.rstrip("/") + "/"):
+            return True
+    return False
+
+
+def ingest(vectordb, sources: list, batch_size: int = EMBED_BATCH_SIZE) -> dict:
+    start = time.perf_counter()
+    stored = vectordb.get(include=["metadatas"])
+    # Solo se sincronizan (y se pueden borrar) los fragmentos de las fuentes de esta ejecución:
+    # `python ingest.py manual.md` no toca el FAQ ni el resto de documentos. Los fragmentos de
+    # esas fuentes con ids de otro esquema (UUID de la indexación anterior) nunca se vuelven a
+    # ver, así que se borran en la primera ejecución y no quedan duplicados
+    existing = {
+        chunk_id for chunk_id, metadata in zip(stored["ids"], stored["metadatas"])
+        if in_sources((metadata or {}).get("source", ""), sources)
+    }
+    seen = set()
+    stats = {"added": 0, "unchanged": 0, "deleted": 0, "embed_batches": 0}
+    batch_ids, batch_texts, batch_metadatas = [], [], []
+
+    def flush():
+        if batch_ids:
+            # add_texts calcula los embeddings del lote en una sola llamada
+            vectordb.add_texts(batch_texts, metadatas=batch_metadatas, ids=batch_ids)
+            stats["added"] += len(batch_ids)
+            stats["embed_batches"] += 1
+            batch_ids.clear()
+            batch_texts.clear()
+            batch_metadatas.clear()
+
+    for chunk_id, text, metadata in iter_chunks(sources):
+        if chunk_id in seen:
+            continue
+        seen.add(chunk_id)
+        if chunk_id in existing:
+            stats["unchanged"] += 1
+            continue
+        batch_ids.append(chunk_id)
+        batch_texts.append(text)
+        batch_metadatas.append(metadata)
+        if len(batch_ids) >= batch_size:
+            flush()
+    flush()
+
+    removed = list(existing - seen)
+    for i in range(0, len(removed), 500):
+        vectordb.delete(ids=removed[i:i + 500])
+    stats["deleted"] = len(removed)
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def open_vectordb(embeddings=None, persist_directory: str = KNOWLEDGE_DB):
+    from langchain_chroma import Chroma
+
+    if embeddings is None:
+        embeddings = get_embedding_function()
+    return Chroma(persist_directory=persist_directory, embedding_function=embeddings, collection_name=collection_name())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexa la base de conocimiento de forma incremental.")
+    parser.add_argument("sources", nargs="*", default=DEFAULT_SOURCES, help="archivos o carpetas a indexar")
+    args = parser.parse_args()
+
+    stats = ingest(open_vectordb(), args.sources)
+    if stats["added"] or stats["deleted"]:
+        # Invalida el caché de respuestas del bot
+        mark_knowledge_updated()
+    print(
+        f"✅ Indexación completada: {stats['added']} nuevos, {stats['unchanged']} sin cambios, "
+        f"{stats['deleted']} eliminados ({stats['embed_batches']} lotes de embeddings, {stats['seconds']}s)"
+    )
@@ -1,34 +1,139 @@
+import atexit
+import copy
+import json
 import logging
-from logging.handlers import TimedRotatingFileHandler
 import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 
 # Asegúrate de que exista la carpeta "logs"
 os.makedirs("logs", exist_ok=True)
 
+# === Configuración ===
+# json (un objeto por línea) o text (formato clásico)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Registros en espera de escribirse a disco; si se llena, se descartan (ver BoundedQueueHandler)
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Fracción de mensajes cuyo texto completo se registra (0.0 - 1.0)
+LOG_MESSAGE_SAMPLE_RATE = float(os.getenv("LOG_MESSAGE_SAMPLE_RATE", "1.0"))
+
+# Campos estructurados que se pasan con `extra={...}`
+STRUCTURED_FIELDS = ("user_id", "classification", "node", "latency_ms", "wait_ms", "fast_path")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Encola registros sin bloquear; con la cola llena descarta en lugar de esperar.
+
+    Los registros WARNING o superiores esperan un instante antes de descartarse.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Igual que QueueHandler.prepare, pero conserva la traza por separado (campo "exc")
+        exc_text = record.exc_text
+        if record.exc_info and not exc_text:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = exc_text
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING:
+                try:
+                    self.queue.put(record, timeout=0.05)
+                    return
+                except queue.Full:
+                    pass
+            self.dropped += 1
+
+
+def _file_handler(filename: str, text_format: str) -> TimedRotatingFileHandler:
+    handler = TimedRotatingFileHandler(
+        filename=filename,
+        when="midnight",
+        interval=30,
+        backupCount=12,
+        encoding="utf-8"
+    )
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(text_format))
+    return handler
+
+
+# En modo webhook cada worker escribe en sus propios archivos (la rotación no es multiproceso)
+_WORKER_ID = os.getenv("TRAKII_WORKER_ID")
+_suffix = f".worker-{_WORKER_ID}" if _WORKER_ID else ""
+
+# === Handlers de archivo: solo los usa el hilo del QueueListener ===
+bot_handler = _file_handler(f"logs/trakii-bot{_suffix}.log", "%(asctime)s - %(message)s")
+error_handler = _file_handler(f"logs/errors{_suffix}.log", "%(asctime)s - %(levelname)s - %(message)s")
+
 # === Logger para actividad general del bot ===
 bot_logger = logging.getLogger("TrakiiBot")
 bot_logger.setLevel(logging.INFO)
-
-bot_handler = TimedRotatingFileHandler(
-    filename="logs/trakii-bot.log",
-    when="midnight",
-    interval=30,
-    backupCount=12,
-    encoding="utf-8"
-)
-bot_handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
-bot_logger.addHandler(bot_handler)
+bot_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+bot_queue_handler = BoundedQueueHandler(bot_queue)
+bot_logger.addHandler(bot_queue_handler)
 
 # === Logger para errores ===
 error_logger = logging.getLogger("TrakiiErrors")
 error_logger.setLevel(logging.ERROR)
+error_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+error_queue_handler = BoundedQueueHandler(error_queue)
+error_logger.addHandler(error_queue_handler)
+
+# La escritura a disco y la rotación ocurren en hilos aparte, nunca en el event loop
+_listeners = [
+    QueueListener(bot_queue, bot_handler, respect_handler_level=True),
+    QueueListener(error_queue, error_handler, respect_handler_level=True),
+]
+for _listener in _listeners:
+    _listener.start()
+
+
+@atexit.register
+def stop_logging():
+    # Vacía las colas pendientes antes de salir
+    for listener in _listeners:
+        if listener._thread is not None:
+            listener.stop()
+
+
+def sample_message(text: str) -> str:
+    """Texto completo para la fracción muestreada de mensajes; si no, solo su longitud."""
+    if LOG_MESSAGE_SAMPLE_RATE >= 1.0 or random.random() < LOG_MESSAGE_SAMPLE_RATE:
+        return text
+    return f"<{len(text)} caracteres>"
+
 
-error_handler = TimedRotatingFileHandler(
-    filename="logs/errors.log",
-    when="midnight",
-    interval=30,
-    backupCount=12,
-    encoding="utf-8"
-)
-error_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
-error_logger.addHandler(error_handler)
+def dropped_records() -> int:
+    return bot_queue_handler.dropped + error_queue_handler.dropped
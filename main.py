@@ -1,44 +1,69 @@
+import asyncio
 import os
+import threading
+import time
+_process_start = time.perf_counter()
+
 from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes
 from dotenv import load_dotenv
-from log_config import bot_logger, error_logger
+from log_config import bot_logger, error_logger, sample_message, dropped_records
 import requests
 
 # LangGraph Agent
-from my_trakii_agent import agent  
+from my_trakii_agent import get_agent, get_checkpointer, warm_up
+from memory import prune_thread
+from tenants import get_registry
+from agent_pool import AgentPool
+from position_stream import stop_all as stop_position_streams
+from traccar_client import close_all as close_traccar_clients
+from rate_limit import (
+    RateLimiter, SharedRateLimiter, USER_RATE_PER_MINUTE, USER_BURST, ACCOUNT_RATE_PER_MINUTE, ACCOUNT_BURST,
+)
+from metrics import (
+    register_gauge, reply_first_byte_latency, request_latency, span, start_metrics_server, token_usage_callback,
+)
+from reply_stream import STREAMING_REPLIES, StreamingReply, run_streaming
+import alerts
+from alerts import ALERTS_ENABLED, AlertEngine, AlertStore
 # config = {"configurable": {"langgraph_user_id": "telegram-user"}} 
 
 load_dotenv()
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+# polling (un proceso) o webhook (ingress + N workers, ver webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+# Inicializa LLM / embeddings / Chroma en segundo plano al arrancar
+WARM_UP = os.getenv("WARM_UP", "true").lower() in ("1", "true", "yes")
 
 # AUTHORIZED_USERS = [7434126358, 289677525, 6779730126, 551723663, 7248786725 ]
 
-# Diccionario de usuarios autorizados y credenciales Traccar
-USER_CREDENTIALS = {
-    #Robert user
-    7434126358: {
-        "username": os.getenv("TRACCAR_USER_ROBERT"),
-        "password": os.getenv("TRACCAR_PASS_ROBERT"),
-    },
-    #Carlos user
-    289677525: {
-        "username": os.getenv("TRACCAR_USER_E2"),
-        "password": os.getenv("TRACCAR_PASS_E2"),
-    },
-    #Usuario hello
-    7248786725: {
-        "username": os.getenv("TRACCAR_USER_E1"),
-        "password": os.getenv("TRACCAR_PASS_E1"),
-    },
-    #Usuario secom
-    884922672: {
-        "username": os.getenv("TRACCAR_USER_E2"),
-        "password": os.getenv("TRACCAR_PASS_E2"),
-    },
-    # Agrega más usuarios según sea necesario
-}
+# Usuarios autorizados y sus cuentas Traccar: tenants.json (TENANTS_FILE), recargado en caliente
+tenants = get_registry()
+
+user_limiter = RateLimiter(USER_RATE_PER_MINUTE, USER_BURST)
+# En modo webhook los usuarios de una cuenta pueden caer en workers distintos: el bucket va a SharedState
+account_limiter = (
+    SharedRateLimiter(ACCOUNT_RATE_PER_MINUTE, ACCOUNT_BURST, prefix="ratelimit:account")
+    if BOT_MODE == "webhook"
+    else RateLimiter(ACCOUNT_RATE_PER_MINUTE, ACCOUNT_BURST)
+)
+
+def traccar_client_for(user_id: int):
+    """Cliente Traccar (uno por cuenta) del usuario, o None si no está autorizado."""
+    account = tenants.account_for(user_id)
+    return account.client if account is not None else None
+
+# Suscripciones a alertas (SQLite compartido por los workers); el motor corre en un solo proceso
+alert_store = AlertStore()
+alert_engine = None
+
+# Pool de ejecución del agente (fuera del event loop, orden por usuario)
+agent_pool = AgentPool()
+register_gauge("trakii_agent_pool", "Agent pool queue and wait stats", agent_pool.stats)
+register_gauge("trakii_tenants", "Registered Telegram users, Traccar accounts and reloads", tenants.stats)
+register_gauge("trakii_rate_limited", "Messages rejected by rate limiting",
+               lambda: {"user": user_limiter.rejected, "account": account_limiter.rejected})
 
 # Manejar mensajes normales
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -50,45 +75,97 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 #        await update.message.reply_text("❌ Acceso no autorizado. Contacta con el administrador.")
 #        return
 
-    if user_id not in USER_CREDENTIALS:
+    tenant = tenants.get(user_id)
+    if tenant is None:
         await update.message.reply_text("❌ Acceso no autorizado. Contacta con el administrador.")
-        return    # Extrae credenciales del usuario
-    credentials = USER_CREDENTIALS[user_id]
-    traccar_username = credentials["username"]
-    traccar_password = credentials["password"]
+        return
+    account = tenant.account
+
+    # ⏳ Límites de consultas por usuario y por cuenta
+    if not user_limiter.allow(user_id, tenant.rate_per_minute, tenant.burst):
+        bot_logger.info(f"[RATE] UserID: {user_id} - Límite de usuario alcanzado", extra={"user_id": user_id})
+        await update.message.reply_text("⏳ Estás enviando demasiadas consultas. Espera unos segundos e inténtalo de nuevo.")
+        return
+    # El bucket compartido (modo webhook) es una transacción SQLite: fuera del event loop
+    if isinstance(account_limiter, SharedRateLimiter):
+        allowed = await asyncio.to_thread(account_limiter.allow, account.key, account.rate_per_minute, account.burst)
+    else:
+        allowed = account_limiter.allow(account.key, account.rate_per_minute, account.burst)
+    if not allowed:
+        bot_logger.info(f"[RATE] UserID: {user_id} - Límite de la cuenta alcanzado", extra={"user_id": user_id})
+        await update.message.reply_text("⏳ Tu cuenta está recibiendo muchas consultas. Inténtalo de nuevo en unos segundos.")
+        return
 
     # Log de entrada del usuario
-    bot_logger.info(f"[INPUT] UserID: {user_id} - Message: {user_text}")
+    bot_logger.info(f"[INPUT] UserID: {user_id} - Message: {sample_message(user_text)}", extra={"user_id": user_id})
 
     state_input = {"user_input": {"message": user_text}}
 
    # Configuración personalizada para LangGraph Agent
+    # Los valores de texto de "configurable" se copian a los metadatos de cada checkpoint:
+    # los handlers reciben la cuenta (con su sesión compartida), nunca las credenciales como texto
+    langgraph_user_id = f"telegram-{user_id}"
     config = {
         "configurable": {
-            "langgraph_user_id": f"telegram-{user_id}",
-            "traccar_username": traccar_username,
-            "traccar_password": traccar_password,
-        }
+            "langgraph_user_id": langgraph_user_id,
+            "thread_id": langgraph_user_id,  # memoria de la conversación por usuario
+            "account": account,
+        },
+        "callbacks": [token_usage_callback],
     }
     
+    # "escribiendo..." mientras se clasifica; las respuestas RAG se muestran a medida que se generan
+    reply = StreamingReply(update.message)
+    reply.start_typing()
     try:
-        # Ejecutar el agente de LangGraph
-        result = agent.invoke(state_input, config=config)
+        # Ejecutar el agente de LangGraph en el pool (no bloquea el event loop)
+        started_at = time.perf_counter()
+        if STREAMING_REPLIES:
+            result = await run_streaming(agent_pool, user_id, get_agent(), state_input, config, reply)
+        else:
+            result = await agent_pool.run(user_id, get_agent().invoke, state_input, config=config)
+        latency = time.perf_counter() - started_at
+        latency_ms = round(latency * 1000, 1)
+        classification = result.get("classification", "unknown")
+        request_latency.observe(latency, classification=classification)
         response = "⚠️ Sin respuesta."
         for message in result["messages"]:
             if hasattr(message, "content"):
                 response = message.content  # guarda el último válido
 
         # Log de salida del agente
-        bot_logger.info(f"[OUTPUT] UserID: {user_id} - Triage & Response: {response}")
+        bot_logger.info(
+            f"[OUTPUT] UserID: {user_id} - Triage & Response: {sample_message(response)}",
+            extra={"user_id": user_id, "latency_ms": latency_ms},
+        )
 
-        # Respuesta al usuario
-        await update.message.reply_text(response, parse_mode="Markdown")
+        # Respuesta al usuario (edita el mensaje provisional si ya se envió)
+        await reply.finish(response)
+        reply_first_byte_latency.observe(reply.first_visible_at - started_at, classification=classification)
+
+        # Archivo generado por el agente (p. ej. el GPX de un recorrido)
+        attachment = result.get("attachment")
+        if attachment:
+            try:
+                with span("telegram", "reply_document"), open(attachment["path"], "rb") as f:
+                    await update.message.reply_document(document=f, filename=attachment["filename"])
+            finally:
+                os.remove(attachment["path"])
 
     except Exception as e:
         # Log de error y respuesta al usuario
-        error_logger.error(f"❌ Error en handle_message: {e}", exc_info=True)
+        error_logger.error(f"❌ Error en handle_message: {e}", exc_info=True, extra={"user_id": user_id})
         await update.message.reply_text("⚠️ Ha ocurrido un error inesperado. Por favor intenta más tarde.")
+    finally:
+        reply.stop_typing()
+
+    # Poda los checkpoints antiguos del usuario (ya respondido: no añade latencia). Va por el
+    # pool con el lock del usuario para no coincidir con otra ejecución de su conversación;
+    # si falla solo se registra, el usuario ya tiene su respuesta
+    try:
+        await agent_pool.run(user_id, prune_thread, get_checkpointer(), langgraph_user_id)
+    except Exception as e:
+        error_logger.error(f"[MEMORY] Falló la poda de {langgraph_user_id}: {e}", exc_info=True, extra={"user_id": user_id})
 
 # Comando /start
 #async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -100,15 +177,96 @@ async def start(update, context):
         "- 📍 Ubicación\n"
         "- 🚗 Velocidad\n"
         "- 🔋 Estado (batería, movimiento, distancia)\n"
-        "- 📋 Listar dispositivos\n\n"
+        "- 📋 Listar dispositivos\n"
+        "- 🔔 Alertas automáticas (/alerta)\n\n"
         "¿Qué necesitas hoy?"
     )
     await update.message.reply_markdown(f"{greeting}\n\n{capabilities}")
-if __name__ == "__main__":
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+
+# Comandos de alertas: /alerta, /alertas, /quitar_alerta (sin LLM; la lista de dispositivos sale del caché)
+async def run_alert_command(update, action):
+    user_id = update.effective_user.id
+    client = traccar_client_for(user_id)
+    if client is None:
+        await update.message.reply_text("❌ Acceso no autorizado. Contacta con el administrador.")
+        return
+    try:
+        response = await asyncio.to_thread(action, client, user_id)
+    except Exception as e:
+        error_logger.error(f"❌ Error en comando de alertas: {e}", exc_info=True, extra={"user_id": user_id})
+        response = "⚠️ Ha ocurrido un error inesperado. Por favor intenta más tarde."
+    await update.message.reply_text(response)
+
+async def alert_command(update, context):
+    text = " ".join(context.args)
+    chat_id = update.effective_chat.id
+    await run_alert_command(update, lambda client, user_id: alerts.subscribe(alert_store, client, user_id, chat_id, text))
+
+async def list_alerts_command(update, context):
+    await run_alert_command(update, lambda client, user_id: alerts.list_subscriptions(alert_store, client, user_id))
+
+async def remove_alert_command(update, context):
+    text = " ".join(context.args)
+    await run_alert_command(update, lambda client, user_id: alerts.unsubscribe(alert_store, user_id, text))
+
+def start_alert_engine(app):
+    global alert_engine
+    loop = asyncio.get_running_loop()
+
+    def notify(chat_id, text):
+        # Desde el hilo del motor: el envío se hace en el event loop del bot
+        asyncio.run_coroutine_threadsafe(app.bot.send_message(chat_id=chat_id, text=text), loop).result(timeout=30)
+
+    alert_engine = AlertEngine(alert_store, traccar_client_for, notify)
+    alert_engine.start()
+    register_gauge("trakii_alerts", "Alert engine cycles and notifications", alert_engine.stats)
+
+async def on_startup(app):
+    bot_logger.info(f"[INIT] Bot listo en {(time.perf_counter() - _process_start) * 1000:.0f} ms")
+    start_metrics_server()
+    if WARM_UP:
+        threading.Thread(target=warm_up, name="trakii-warm-up", daemon=True).start()
+    # En modo webhook solo el worker 0 evalúa alertas (si no, cada aviso llegaría N veces)
+    if ALERTS_ENABLED and os.getenv("TRAKII_WORKER_ID", "0") == "0":
+        start_alert_engine(app)
+
+async def on_shutdown(app):
+    bot_logger.info(f"[POOL] Estadísticas finales: {agent_pool.stats()} - Logs descartados: {dropped_records()}")
+    agent_pool.shutdown()
+    if alert_engine is not None:
+        alert_engine.stop()
+    stop_position_streams()
+    close_traccar_clients()
+
+def build_application(updater: bool = True):
+    # concurrent_updates: los updates se procesan en paralelo; el límite real lo impone agent_pool
+    builder = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(True)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if not updater:
+        # Modo webhook: los updates llegan desde el proceso ingress, no por long-polling
+        builder = builder.updater(None)
+    app = builder.build()
 
     app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("alerta", alert_command))
+    app.add_handler(CommandHandler("alertas", list_alerts_command))
+    app.add_handler(CommandHandler("quitar_alerta", remove_alert_command))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return app
+
+if __name__ == "__main__":
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+
+        print("🤖 TrakiiBot está corriendo en modo webhook...")
+        run_webhook(build_application)
+    else:
+        app = build_application()
 
-    print("🤖 TrakiiBot está corriendo...")
-    app.run_polling()
+        print("🤖 TrakiiBot está corriendo...")
+        app.run_polling()
@@ -0,0 +1,149 @@
+import os
+import sqlite3
+
+from langgraph.graph import add_messages
+
+from log_config import bot_logger, error_logger
+
+# === Memoria conversacional (checkpointer de LangGraph + store) ===
+# sqlite (por defecto, un archivo local compartido por los workers), redis o memory (solo desarrollo)
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "sqlite").lower()
+MEMORY_DB = os.getenv("MEMORY_DB", "state/trakii-memory.db")
+MEMORY_STORE_DB = os.getenv("MEMORY_STORE_DB", "state/trakii-store.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+# Mensajes que se conservan por usuario (ventana deslizante)
+MEMORY_MAX_MESSAGES = int(os.getenv("MEMORY_MAX_MESSAGES", "20"))
+# Checkpoints que se conservan por usuario en SQLite (solo el último hace falta para continuar)
+MEMORY_KEEP_CHECKPOINTS = int(os.getenv("MEMORY_KEEP_CHECKPOINTS", "2"))
+# Redis: caducidad de la conversación sin actividad
+MEMORY_TTL_MINUTES = int(os.getenv("MEMORY_TTL_MINUTES", str(7 * 24 * 60)))
+
+
+def _sqlite_connection(path: str, **kwargs) -> sqlite3.Connection:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Los savers de LangGraph serializan el acceso con su propio lock
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=5, **kwargs)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def create_checkpointer(backend: str = MEMORY_BACKEND):
+    """Checkpointer del grafo: guarda el estado de cada conversación (thread_id = usuario)."""
+    try:
+        if backend == "sqlite":
+            from langgraph.checkpoint.sqlite import SqliteSaver
+
+            saver = SqliteSaver(_sqlite_connection(MEMORY_DB))
+            saver.setup()
+            return saver
+        if backend == "redis":
+            from langgraph.checkpoint.redis import RedisSaver  # opcional: pip install langgraph-checkpoint-redis
+
+            saver = RedisSaver(redis_url=REDIS_URL, ttl={"default_ttl": MEMORY_TTL_MINUTES, "refresh_on_read": True})
+            saver.setup()
+            return saver
+    except Exception as e:
+        error_logger.error(f"[MEMORY] No se pudo crear el checkpointer '{backend}': {e}; se usa memoria del proceso")
+    from langgraph.checkpoint.memory import MemorySaver
+
+    return MemorySaver()
+
+
+def create_store(backend: str = MEMORY_BACKEND):
+    """Store de LangGraph (memoria a largo plazo) en el mismo backend que el checkpointer.
+
+    Sin índice semántico: en SQLite requeriría la extensión sqlite-vec, que no es
+    dependencia del proyecto, y el store caería siempre a memoria del proceso.
+    """
+    try:
+        if backend == "sqlite":
+            from langgraph.store.sqlite import SqliteStore
+
+            store = SqliteStore(_sqlite_connection(MEMORY_STORE_DB, isolation_level=None))
+            store.setup()
+            return store
+        if backend == "redis":
+            from langgraph.store.redis import RedisStore
+
+            store = RedisStore(REDIS_URL)
+            store.setup()
+            return store
+    except Exception as e:
+        error_logger.error(f"[MEMORY] No se pudo crear el store '{backend}': {e}; se usa memoria del proceso")
+    from langgraph.store.memory import InMemoryStore
+
+    return InMemoryStore()
+
+
+def prune_thread(checkpointer, thread_id: str, keep: int = MEMORY_KEEP_CHECKPOINTS):
+    """Borra los checkpoints antiguos de una conversación (SQLite o memoria del proceso).
+
+    LangGraph guarda un checkpoint por paso del grafo; sin poda el almacenamiento
+    crece con cada mensaje aunque el estado esté acotado. Redis no se poda: sus
+    checkpoints se acumulan hasta que caduca la conversación (MEMORY_TTL_MINUTES).
+    Debe llamarse con el lock del usuario (AgentPool.run), sin otra ejecución de su
+    conversación en curso.
+    """
+    from langgraph.checkpoint.memory import MemorySaver
+
+    if isinstance(checkpointer, MemorySaver):
+        deleted = _prune_memory(checkpointer, thread_id, keep)
+    elif isinstance(getattr(checkpointer, "conn", None), sqlite3.Connection):
+        deleted = _prune_sqlite(checkpointer, thread_id, keep)
+    else:
+        return
+    if deleted:
+        bot_logger.debug(f"[MEMORY] {deleted} checkpoints antiguos eliminados de {thread_id}")
+
+
+def _prune_sqlite(checkpointer, thread_id: str, keep: int) -> int:
+    conn = checkpointer.conn
+    try:
+        with checkpointer.lock, conn:
+            deleted = conn.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id NOT IN ("
+                " SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ''"
+                " ORDER BY checkpoint_id DESC LIMIT ?)",
+                (thread_id, thread_id, keep),
+            ).rowcount
+            conn.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_id NOT IN ("
+                " SELECT checkpoint_id FROM checkpoints WHERE thread_id = ?)",
+                (thread_id, thread_id),
+            )
+    except sqlite3.Error as e:
+        # No es crítico: se reintenta en el siguiente mensaje del usuario
+        error_logger.error(f"[MEMORY] No se pudieron podar los checkpoints de {thread_id}: {e}")
+        return 0
+    return deleted
+
+
+def _prune_memory(saver, thread_id: str, keep: int) -> int:
+    # MemorySaver guarda los valores de los canales aparte (blobs), por versión: se conservan
+    # solo los que usan los checkpoints que quedan
+    deleted = 0
+    referenced = set()
+    for checkpoint_ns, checkpoints in list(saver.storage.get(thread_id, {}).items()):
+        # Los ids de checkpoint son ordenables por tiempo
+        ordered = sorted(checkpoints, reverse=True)
+        for checkpoint_id in ordered[keep:]:
+            del checkpoints[checkpoint_id]
+            saver.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            deleted += 1
+        for checkpoint_id in ordered[:keep]:
+            checkpoint = saver.serde.loads_typed(checkpoints[checkpoint_id][0])
+            referenced.update((checkpoint_ns, k, v) for k, v in checkpoint["channel_versions"].items())
+    # Otros usuarios escriben blobs a la vez: se recorre una copia de las claves
+    # (list() sobre el dict es atómico con el GIL; un bucle Python no)
+    for key in list(saver.blobs):
+        if key[0] == thread_id and key[1:] not in referenced:
+            saver.blobs.pop(key, None)
+    return deleted
+
+
+def bounded_messages(left: list, right: list) -> list:
+    """Reducer de `messages`: como add_messages, pero conserva solo los últimos MEMORY_MAX_MESSAGES."""
+    merged = add_messages(left, right)
+    return merged[-MEMORY_MAX_MESSAGES:] if MEMORY_MAX_MESSAGES > 0 else merged
@@ -0,0 +1,242 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from log_config import bot_logger, error_logger
+
+# === Configuración ===
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 desactiva el endpoint
+OTEL_ENABLED = bool(os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"))
+
+# Buckets en segundos: de 5 ms a 30 s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Histograma acumulativo estilo Prometheus con etiquetas."""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: dict = {}  # labels -> [conteos por bucket (+Inf al final), suma]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def quantile(self, q: float, counts: list) -> float:
+        """Estimación por interpolación lineal dentro del bucket (como histogram_quantile)."""
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        lower = 0.0
+        for i, count in enumerate(counts[:-1]):
+            upper = self.buckets[i]
+            if cumulative + count >= rank:
+                return lower + (upper - lower) * ((rank - cumulative) / count if count else 0)
+            cumulative += count
+            lower = upper
+        return self.buckets[-1]
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        quantile_lines = [
+            f"# HELP {self.name}_quantile Estimated {self.help.lower()} quantiles",
+            f"# TYPE {self.name}_quantile gauge",
+        ]
+        with self._lock:
+            snapshot = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        for key, counts, total in snapshot:
+            labels = ",".join(f'{n}="{v}"' for n, v in zip(self.labelnames, key))
+            sep = "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+            for q in QUANTILES:
+                quantile_lines.append(f'{self.name}_quantile{{{labels}{sep}quantile="{q}"}} {self.quantile(q, counts):.6f}')
+        return lines + quantile_lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            labels = ",".join(f'{n}="{v}"' for n, v in zip(self.labelnames, key))
+            lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+# === Métricas del bot ===
+node_latency = Histogram("trakii_node_latency_seconds", "Graph node latency", ("node",))
+request_latency = Histogram("trakii_request_latency_seconds", "End-to-end reply latency", ("classification",))
+reply_first_byte_latency = Histogram(
+    "trakii_reply_first_byte_seconds", "Time until the user sees reply text", ("classification",)
+)
+upstream_latency = Histogram("trakii_upstream_latency_seconds", "Upstream call latency", ("service", "operation"))
+upstream_errors = Counter("trakii_upstream_errors_total", "Failed upstream calls", ("service", "operation"))
+llm_tokens = Counter("trakii_llm_tokens_total", "LLM tokens used", ("kind",))
+
+_metrics = [node_latency, request_latency, reply_first_byte_latency, upstream_latency, upstream_errors, llm_tokens]
+_gauges: dict = {}  # nombre -> (ayuda, función que devuelve {etiqueta: valor} o un número)
+
+
+def register_gauge(name: str, help_text: str, fn):
+    """Valor leído en el momento del scrape (estadísticas de cachés, pool, etc.)."""
+    _gauges[name] = (help_text, fn)
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for name, (help_text, fn) in _gauges.items():
+        try:
+            value = fn()
+        except Exception as e:
+            error_logger.error(f"[METRICS] Error leyendo {name}: {e}")
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        if isinstance(value, dict):
+            for label, v in value.items():
+                lines.append(f'{name}{{key="{label}"}} {v}')
+        else:
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# === OpenTelemetry (opcional) ===
+_tracer = None
+if OTEL_ENABLED:
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        _provider = TracerProvider(resource=Resource.create({"service.name": "trakii-bot"}))
+        _provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        trace.set_tracer_provider(_provider)
+        _tracer = trace.get_tracer("trakii-bot")
+    except ImportError:
+        error_logger.error("[METRICS] OTEL_EXPORTER_OTLP_ENDPOINT definido pero opentelemetry no está instalado")
+
+
+# === ⏱️ Instrumentación ===
+@contextmanager
+def span(service: str, operation: str):
+    """Mide una llamada externa (Traccar, OpenAI, Chroma, Telegram)."""
+    otel_span = _tracer.start_as_current_span(f"{service}.{operation}") if _tracer else None
+    if otel_span:
+        otel_span.__enter__()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        upstream_errors.inc(service=service, operation=operation)
+        raise
+    finally:
+        upstream_latency.observe(time.perf_counter() - start, service=service, operation=operation)
+        if otel_span:
+            otel_span.__exit__(None, None, None)
+
+
+def traced(node: str):
+    """Decorador para nodos del grafo: registra su latencia en `trakii_node_latency_seconds`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            otel_span = _tracer.start_as_current_span(node) if _tracer else None
+            if otel_span:
+                otel_span.__enter__()
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                node_latency.observe(time.perf_counter() - start, node=node)
+                if otel_span:
+                    otel_span.__exit__(None, None, None)
+        return wrapper
+    return decorator
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    """Suma los tokens de cada llamada al LLM (se pasa en `callbacks` al invocar el agente)."""
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if not usage:
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    usage = {"prompt_tokens": metadata.get("input_tokens", 0), "completion_tokens": metadata.get("output_tokens", 0)}
+        llm_tokens.inc(usage.get("prompt_tokens", 0), kind="prompt")
+        llm_tokens.inc(usage.get("completion_tokens", 0), kind="completion")
+
+
+token_usage_callback = TokenUsageCallback()
+
+
+# === 🌐 Endpoint /metrics ===
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="trakii-metrics", daemon=True).start()
+    bot_logger.info(f"[METRICS] Endpoint disponible en http://{host}:{port}/metrics")
+    return server
@@ -1,29 +1,34 @@
 import os
-import requests
-from requests.auth import HTTPBasicAuth
+import re
+import threading
+import time
 from datetime import datetime
 from dotenv import load_dotenv
 
-from typing_extensions import TypedDict, Literal, Annotated
+from typing_extensions import TypedDict, Literal, Annotated, Optional
 from pydantic import BaseModel, Field
 
-from langchain.chains import RetrievalQA
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-
 from langchain.chat_models import init_chat_model
 from langgraph.types import Command
-from langgraph.graph import add_messages, StateGraph, START, END
-from langgraph.store.memory import InMemoryStore
+from langgraph.graph import StateGraph, START, END
 
 from log_config import bot_logger, error_logger
+from device_cache import device_cache
+from device_resolver import normalize
+from position_stream import get_stream
 
 from prompts import triage_system_prompt, triage_user_prompt
+from fast_triage import classify as fast_classify, triage_stats
+from answer_cache import answer_cache, KNOWLEDGE_DB
+from embeddings import EMBEDDINGS_BACKEND, collection_name, get_embedding_function
+from metrics import register_gauge, span, traced
+from rate_limit import single_flight
+from memory import bounded_messages, create_checkpointer, create_store
+import reports
 
 # === Load environment variables ===
 _ = load_dotenv()
 
-TRACCAR_URL = os.getenv("TRACCAR_URL")
 #TRACCAR_USERNAME = os.getenv("TRACCAR_USERNAME")
 #TRACCAR_PASSWORD = os.getenv("TRACCAR_PASSWORD")
 
@@ -46,35 +51,127 @@ prompt_instructions = {
         "speed": "When the user asks about how fast the device is going, current speed, or any synonym for the above on English or Spanish.",
         "status": "When the user asks whether the device is online, the battery level, last time it reported data, or any synonym for the above on English or Spanish.",
         "list": "When the user asks to list all devices, see available GPS trackers, or get a catalog of registered units.",
+        "route": "When the user asks how many kilometers a device traveled, its route, maximum speed or a GPX file for a past period (today, yesterday, this week), in English or Spanish.",
+        "trips": "When the user asks about the trips or journeys a device made during a period, in English or Spanish.",
+        "stops": "When the user asks where or how long a device stopped or was parked during a period, in English or Spanish.",
         "ask": "When the user asks general questions (Who is Trakii, what can you do, how does it work?).",
         "ignore": "If the message is not related to location, speed or status.",  
     },
     "agent_instructions": "Classify incoming Telegram messages into the correct type of request for a GPS tracking system.",
 }
 
-# === LangGraph memory and model setup ===
-store = InMemoryStore(index={"embed": "openai:text-embedding-3-small"})
-llm = init_chat_model("openai:gpt-4o-mini")
-
-# Configura RAG
-vectordb = Chroma(persist_directory="knowledge_db", embedding_function=OpenAIEmbeddings())
-qa_chain = RetrievalQA.from_chain_type(llm=llm, chain_type="stuff", retriever=vectordb.as_retriever())
+# === LangGraph memory and model setup (lazy) ===
+# Los clientes de LLM, embeddings, Chroma, el checkpointer, el store y el grafo
+# compilado se crean en el primer uso (o en warm_up), no al importar el módulo.
+# Un lock por singleton: la primera consulta no espera al warm-up de otro cliente
+_singletons: dict = {}
+_singleton_locks: dict = {}
+_singletons_lock = threading.Lock()
+startup_timings: dict = {}
+
+def _lock_for(name: str) -> threading.Lock:
+    with _singletons_lock:
+        return _singleton_locks.setdefault(name, threading.Lock())
+
+def _lazy(name: str, factory):
+    instance = _singletons.get(name)
+    if instance is None:
+        with _lock_for(name):
+            instance = _singletons.get(name)
+            if instance is None:
+                start = time.perf_counter()
+                instance = factory()
+                startup_timings[name] = time.perf_counter() - start
+                bot_logger.info(f"[INIT] {name} inicializado en {startup_timings[name] * 1000:.0f} ms")
+                _singletons[name] = instance
+    return instance
+
+def _create_store():
+    # Persistente (SQLite/Redis) según MEMORY_BACKEND. Sin índice semántico: no depende
+    # de los embeddings, y si el backend falla create_store usa memoria del proceso,
+    # así que compilar el grafo nunca falla por el store
+    return create_store()
+
+def _create_vectordb():
+    from langchain_chroma import Chroma
+    return Chroma(persist_directory=KNOWLEDGE_DB, embedding_function=get_embeddings(), collection_name=collection_name())
+
+def _create_embeddings():
+    # Backend configurable (OpenAI o modelo local) con caché persistente de vectores
+    return get_embedding_function()
+
+def _create_qa_chain():
+    # Configura RAG
+    from langchain.chains import RetrievalQA
+    return RetrievalQA.from_chain_type(llm=get_llm(), chain_type="stuff", retriever=get_vectordb().as_retriever())
+
+def get_store():
+    return _lazy("store", _create_store)
+
+def get_checkpointer():
+    # La conversación de cada usuario (thread_id) se guarda entre mensajes y reinicios
+    return _lazy("checkpointer", create_checkpointer)
+
+def get_agent():
+    return _lazy("agent", lambda: agent_graph.compile(checkpointer=get_checkpointer(), store=get_store()))
+
+def get_llm():
+    # stream_usage: las respuestas en streaming también informan de los tokens usados
+    return _lazy("llm", lambda: init_chat_model("openai:gpt-4o-mini", stream_usage=True))
+
+def get_llm_router():
+    return _lazy("llm_router", lambda: get_llm().with_structured_output(Router))
+
+def get_embeddings():
+    return _lazy("embeddings", _create_embeddings)
+
+def get_vectordb():
+    return _lazy("vectordb", _create_vectordb)
+
+def get_qa_chain():
+    return _lazy("qa_chain", _create_qa_chain)
+
+def warm_up():
+    """Inicializa por adelantado los clientes usados en el camino caliente y registra los tiempos."""
+    start = time.perf_counter()
+    for getter in (get_llm, get_llm_router, get_embeddings, get_vectordb, get_qa_chain, get_agent):
+        try:
+            getter()
+        except Exception as e:
+            error_logger.error(f"[INIT] Warm-up falló en {getter.__name__}: {e}", exc_info=True)
+    report = ", ".join(f"{name}={t * 1000:.0f}ms" for name, t in startup_timings.items())
+    bot_logger.info(f"[INIT] Warm-up completado en {(time.perf_counter() - start) * 1000:.0f} ms ({report})")
 
 class Router(BaseModel):
     reasoning: str = Field(description="Step-by-step reasoning behind the classification.")
-    classification: Literal["location", "speed", "status", "list", "ask", "ignore"] = Field(description="The type of query requested by the user")
-
-llm_router = llm.with_structured_output(Router)
+    classification: Literal["location", "speed", "status", "list", "ask", "route", "trips", "stops", "ignore"] = Field(description="The type of query requested by the user")
 
 class State(TypedDict):
     user_input: dict
-    messages: Annotated[list, add_messages]
+    messages: Annotated[list, bounded_messages]
+    classification: str
+    last_devices: list  # IDs de la última consulta, para seguimientos ("¿y su velocidad?")
+    attachment: Optional[dict]  # archivo a enviar con la respuesta ({"path", "filename"}), solo en este turno
 
 # === Routing function ===
-def triage_router(state: State, config, store) -> Command[Literal["handle_location", "handle_speed", "handle_status", "handle_list", "handle_ask", "handle_ignore"]]:
+def triage_router(state: State, config, store) -> Command[Literal["handle_location", "handle_speed", "handle_status", "handle_list", "handle_ask", "handle_route", "handle_trips", "handle_stops", "handle_ignore"]]:
     message = state['user_input']['message']
     langgraph_user_id = config['configurable']['langgraph_user_id']
 
+    # ⚡ Fast-path: intenciones obvias se clasifican localmente, sin llamar al LLM
+    fast = fast_classify(message)
+    if fast:
+        triage_stats.record(fast_path=True)
+        bot_logger.info(
+            f"[TRIAGE] Clasificación: {fast.classification} (fast-path, confianza {fast.confidence:.2f}) "
+            f"- Tasa fast-path: {triage_stats.fast_rate:.0%}",
+            extra={"user_id": langgraph_user_id, "classification": fast.classification, "fast_path": True},
+        )
+        return Command(
+            goto=f"handle_{fast.classification}",
+            update={"messages": [{"role": "user", "content": message}], "classification": fast.classification, "attachment": None}
+        )
+
     rules = prompt_instructions["triage_rules"]
 
     system_prompt = triage_system_prompt.format(
@@ -85,182 +182,306 @@ def triage_router(state: State, config, store) -> Command[Literal["handle_locati
         triage_status=rules["status"],
         triage_list=rules["list"],
         triage_ask=rules["ask"],
+        triage_route=rules["route"],
+        triage_trips=rules["trips"],
+        triage_stops=rules["stops"],
         triage_no=rules["ignore"],
         name=profile["name"],
         examples=None,
     )
     user_prompt = triage_user_prompt.format(message=message)
 
-    result = llm_router.invoke([
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_prompt},
-    ])
-
-    print(f"🧠 Reasoning: {result.reasoning}")
-    print(f"📦 Classified as: {result.classification}")
-    bot_logger.info(f"[TRIAGE] Clasificación: {result.classification}")
+    def classify():
+        with span("openai", "triage"):
+            return get_llm_router().invoke([
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ])
+
+    # Mensajes idénticos en curso comparten una sola llamada al LLM
+    result = single_flight.do(("triage", normalize(message)), classify)
+
+    bot_logger.debug(f"🧠 Reasoning: {result.reasoning}", extra={"node": "triage_router"})
+    triage_stats.record(fast_path=False)
+    bot_logger.info(
+        f"[TRIAGE] Clasificación: {result.classification} (LLM) - Tasa fast-path: {triage_stats.fast_rate:.0%}",
+        extra={"user_id": langgraph_user_id, "classification": result.classification, "fast_path": False},
+    )
     return Command(
         goto=f"handle_{result.classification}",
-        update={"messages": [{"role": "user", "content": message}]}
+        update={"messages": [{"role": "user", "content": message}], "classification": result.classification, "attachment": None}
     )
 
 # === 🛰️ Handler functions ===
 
+# Palabras que piden todos los dispositivos de la cuenta ("estado de todos")
+ALL_DEVICES_PATTERN = re.compile(r"\b(todos|todas|all|every)\b")
+# A partir de cuántos dispositivos se piden todas las posiciones de la cuenta de una vez
+BULK_POSITIONS_THRESHOLD = 20
+# Segundos que las posiciones leídas por HTTP se reutilizan entre los usuarios de una misma cuenta
+POSITIONS_CACHE_TTL = float(os.getenv("POSITIONS_CACHE_TTL", "5"))
+_recent_positions: dict = {}  # (base_url, username) -> {deviceId: (instante, posición)}
+MAX_TABLE_ROWS = 50
+
+def account_client(config):
+    """Cliente Traccar de la cuenta que main.py pasa en `configurable` (None si no hay)."""
+    account = config["configurable"].get("account")
+    return account.client if account is not None else None
+
+def resolve_devices(client, user_message: str, last_devices: list = ()) -> list:
+    resolver = device_cache.resolver(client)
+    if ALL_DEVICES_PATTERN.search(normalize(user_message)):
+        return resolver.devices
+    devices = resolver.resolve(user_message)
+    if not devices and last_devices:
+        # Seguimiento sin dispositivo ("¿y su velocidad?"): se reutilizan los de la consulta anterior
+        devices = resolver.by_ids(last_devices)
+    return devices
+
+def remember_devices(update: dict, devices: list) -> dict:
+    """Añade a la respuesta del nodo los dispositivos consultados (acotados a MAX_TABLE_ROWS)."""
+    if devices:
+        update["last_devices"] = [d["id"] for d in devices[:MAX_TABLE_ROWS]]
+    return update
+
+def fetch_positions(client, devices: list) -> dict:
+    """Última posición de cada dispositivo (por deviceId).
+
+    Primero se lee la tabla del WebSocket (si está activo); lo que falte se pide
+    a Traccar en una sola petición. Consultas simultáneas de la misma cuenta por
+    los mismos dispositivos comparten esa petición.
+    """
+    key = ("positions", client.base_url, client.username, tuple(sorted(d["id"] for d in devices)))
+    return single_flight.do(key, lambda: _fetch_positions(client, devices))
+
+def _fetch_positions(client, devices: list) -> dict:
+    result = {}
+    stream = get_stream(client)
+    if stream is not None:
+        result = stream.latest(d["id"] for d in devices)
+        devices = [d for d in devices if d["id"] not in result]
+
+    now = time.monotonic()
+    recent = _recent_positions.setdefault((client.base_url, client.username), {})
+    for d in devices:
+        cached = recent.get(d["id"])
+        if cached is not None and now - cached[0] < POSITIONS_CACHE_TTL:
+            result.setdefault(d["id"], cached[1])
+    devices = [d for d in devices if d["id"] not in result]
+
+    position_ids = [d["positionId"] for d in devices if d.get("positionId")]
+    if not position_ids:
+        return result
+    if len(position_ids) > BULK_POSITIONS_THRESHOLD:
+        # Sin id, /api/positions devuelve la última posición de todos los dispositivos
+        positions = client.get_positions()
+    else:
+        positions = client.get_positions(position_ids)
+    for p in positions:
+        recent[p["deviceId"]] = (now, p)
+        result.setdefault(p["deviceId"], p)
+    return result
+
+CONNECTION_LABELS = {"online": "🟢 En línea", "offline": "🔴 Desconectado", "unknown": "⚪ Desconocido"}
+
+def device_statuses(client, devices: list) -> dict:
+    """Estado de conexión de cada dispositivo (por deviceId).
+
+    El del WebSocket si está conectado (llega al instante); si no, el de la lista
+    de dispositivos, que puede tener la antigüedad del caché.
+    """
+    result = {d["id"]: d.get("status") for d in devices}
+    stream = get_stream(client)
+    if stream is not None:
+        result.update(stream.statuses(d["id"] for d in devices))
+    return result
+
+def format_table(headers: list, rows: list) -> str:
+    shown = rows[:MAX_TABLE_ROWS]
+    widths = [max(len(str(r[i])) for r in [headers] + shown) for i in range(len(headers))]
+    lines = ["  ".join(str(value).ljust(widths[i]) for i, value in enumerate(row)).rstrip() for row in [headers] + shown]
+    table = "```\n" + "\n".join(lines) + "\n```"
+    if len(rows) > MAX_TABLE_ROWS:
+        table += f"\n… y {len(rows) - MAX_TABLE_ROWS} dispositivos más."
+    return table
+
+def format_fix_time(fix_time) -> str:
+    if not fix_time:
+        return "No disponible"
+    return datetime.fromisoformat(fix_time.replace("Z", "+00:00")).strftime("%m/%d/%Y, %I:%M:%S %p")
+
+def speed_kph(position: dict) -> float:
+    return round(position["speed"] * 1.852, 1)
+
 def handle_location(state: State, config):
-    print("📍 Handling location query...")
+    bot_logger.debug("📍 Handling location query...", extra={"node": "handle_location"})
     user_message = state["messages"][-1].content.lower()
 
- # 🔐 Obtén credenciales personalizadas desde el config
-    traccar_username = config["configurable"].get("traccar_username")
-    traccar_password = config["configurable"].get("traccar_password")
+    # 🔐 Cliente Traccar de la cuenta del usuario (main.py pasa la cuenta en el config; no se guarda en la memoria)
+    client = account_client(config)
 
-    if not traccar_username or not traccar_password:
+    if client is None:
         return {"messages": [{"role": "assistant", "content": "⚠️ No se configuraron credenciales para Traccar."}]}
 
     
+    devices = []
     try:
-        devices = requests.get(
-            f"{TRACCAR_URL}/api/devices",
-            auth=HTTPBasicAuth(traccar_username, traccar_password)
-        ).json()
-
-        matched_device = next((d for d in devices if d["name"].lower() in user_message or str(d["id"]) in user_message), None)
+        devices = resolve_devices(client, user_message, state.get("last_devices", []))
 
-        if not matched_device:
+        if not devices:
             content = "No pude encontrar un dispositivo que coincida con tu mensaje."
         else:
-            position = requests.get(
-                f"{TRACCAR_URL}/api/positions/?id={matched_device['positionId']}",
-                auth=HTTPBasicAuth(traccar_username, traccar_password)
-            ).json()[0]
-
-            latitude = position["latitude"]
-            longitude = position["longitude"]
-
-            content = (
-                f"📍 Ubicación del dispositivo '{matched_device['name']}':\n"
-                f"Latitud: {latitude}, Longitud: {longitude}\n"
-                f"[Ver en Google Maps](https://www.google.com/maps?q={latitude},{longitude})"
-            )
+            positions = fetch_positions(client, devices)
+
+            if len(devices) == 1 and devices[0]["id"] not in positions:
+                content = f"⚠️ El dispositivo '{devices[0]['name']}' aún no tiene posiciones registradas."
+            elif len(devices) == 1:
+                position = positions[devices[0]["id"]]
+                latitude = position["latitude"]
+                longitude = position["longitude"]
+
+                content = (
+                    f"📍 Ubicación del dispositivo '{devices[0]['name']}':\n"
+                    f"Latitud: {latitude}, Longitud: {longitude}\n"
+                    f"[Ver en Google Maps](https://www.google.com/maps?q={latitude},{longitude})"
+                )
+            else:
+                lines = [f"📍 Ubicación de {len(devices)} dispositivos:"]
+                for d in devices[:MAX_TABLE_ROWS]:
+                    position = positions.get(d["id"])
+                    if position is None:
+                        lines.append(f"- {d['name']}: sin posición")
+                    else:
+                        latitude, longitude = position["latitude"], position["longitude"]
+                        lines.append(f"- {d['name']}: [{latitude}, {longitude}](https://www.google.com/maps?q={latitude},{longitude})")
+                if len(devices) > MAX_TABLE_ROWS:
+                    lines.append(f"… y {len(devices) - MAX_TABLE_ROWS} dispositivos más.")
+                content = "\n".join(lines)
     except Exception as e:
-        print("❌ Error:", e)
+        error_logger.error(f"❌ Error en handle_location: {e}", exc_info=True, extra={"node": "handle_location"})
         content = "Error al obtener la ubicación del dispositivo."
 
-    return {"messages": [{"role": "assistant", "content": content}]}
+    return remember_devices({"messages": [{"role": "assistant", "content": content}]}, devices)
 
 def handle_speed(state: State, config):
-    print("🚗 Handling speed query...")
+    bot_logger.debug("🚗 Handling speed query...", extra={"node": "handle_speed"})
     user_message = state["messages"][-1].content.lower()
- # 🔐 Obtén credenciales personalizadas desde el config
-    traccar_username = config["configurable"].get("traccar_username")
-    traccar_password = config["configurable"].get("traccar_password")
+    # 🔐 Cliente Traccar de la cuenta del usuario (main.py pasa la cuenta en el config; no se guarda en la memoria)
+    client = account_client(config)
 
-    if not traccar_username or not traccar_password:
+    if client is None:
         return {"messages": [{"role": "assistant", "content": "⚠️ No se configuraron credenciales para Traccar."}]}
 
     
+    devices = []
     try:
-        devices = requests.get(
-            f"{TRACCAR_URL}/api/devices",
-            auth=HTTPBasicAuth(traccar_username, traccar_password)
-        ).json()
-
-        matched_device = next((d for d in devices if d["name"].lower() in user_message or str(d["id"]) in user_message), None)
+        devices = resolve_devices(client, user_message, state.get("last_devices", []))
 
-        if not matched_device:
+        if not devices:
             content = "No encontré un dispositivo que coincida con tu mensaje."
         else:
-            position = requests.get(
-                f"{TRACCAR_URL}/api/positions/?id={matched_device['positionId']}",
-                auth=HTTPBasicAuth(traccar_username, traccar_password)
-            ).json()[0]
-
-            speed_kph = round(position["speed"] * 1.852, 1)
-            content = f"🚗 El dispositivo '{matched_device['name']}' se mueve a {speed_kph} km/h."
+            positions = fetch_positions(client, devices)
+
+            if len(devices) == 1 and devices[0]["id"] not in positions:
+                content = f"⚠️ El dispositivo '{devices[0]['name']}' aún no tiene posiciones registradas."
+            elif len(devices) == 1:
+                content = f"🚗 El dispositivo '{devices[0]['name']}' se mueve a {speed_kph(positions[devices[0]['id']])} km/h."
+            else:
+                rows = [
+                    [d["name"], f"{speed_kph(positions[d['id']])} km/h" if d["id"] in positions else "sin posición"]
+                    for d in devices
+                ]
+                content = f"🚗 Velocidad de {len(devices)} dispositivos:\n" + format_table(["Dispositivo", "Velocidad"], rows)
     except Exception as e:
-        print("❌ Error:", e)
+        error_logger.error(f"❌ Error en handle_speed: {e}", exc_info=True, extra={"node": "handle_speed"})
         content = "Error al obtener la velocidad del dispositivo."
 
-    return {"messages": [{"role": "assistant", "content": content}]}
+    return remember_devices({"messages": [{"role": "assistant", "content": content}]}, devices)
 
 def handle_status(state: State, config):
-    print("🔋 Handling status query...")
+    bot_logger.debug("🔋 Handling status query...", extra={"node": "handle_status"})
     user_message = state["messages"][-1].content.lower()
 
-     # 🔐 Obtén credenciales personalizadas desde el config
-    traccar_username = config["configurable"].get("traccar_username")
-    traccar_password = config["configurable"].get("traccar_password")
+    # 🔐 Cliente Traccar de la cuenta del usuario (main.py pasa la cuenta en el config; no se guarda en la memoria)
+    client = account_client(config)
 
-    if not traccar_username or not traccar_password:
+    if client is None:
         return {"messages": [{"role": "assistant", "content": "⚠️ No se configuraron credenciales para Traccar."}]}
 
     
 
+    devices = []
     try:
-        devices = requests.get(
-            f"{TRACCAR_URL}/api/devices",
-            auth=HTTPBasicAuth(traccar_username, traccar_password)
-        ).json()
-
-        matched_device = next((d for d in devices if d["name"].lower() in user_message or str(d["id"]) in user_message), None)
+        devices = resolve_devices(client, user_message, state.get("last_devices", []))
 
-        if not matched_device:
+        if not devices:
             content = "No encontré un dispositivo que coincida con tu mensaje."
         else:
-            position = requests.get(
-                f"{TRACCAR_URL}/api/positions/?id={matched_device['positionId']}",
-                auth=HTTPBasicAuth(traccar_username, traccar_password)
-            ).json()[0]
-
-            attributes = position.get("attributes", {})
-            battery_level = attributes.get("batteryLevel", "No disponible")
-            battery = attributes.get("battery", "No disponible")
-            total_distance = round(attributes.get("totalDistance", 0) / 1000, 2)
-
-            fix_time = position.get("fixTime")
-            motion = attributes.get("motion", False)
-            motion_status = "🟢 En movimiento" if motion else "🔴 Detenido"
-
-            fix_time_str = (
-                datetime.fromisoformat(fix_time.replace("Z", "+00:00")).strftime("%m/%d/%Y, %I:%M:%S %p")
-                if fix_time else "No disponible"
-            )
-
-            content = (
-                f"📡 Estado del dispositivo '{matched_device['name']}':\n"
-                f"```\n"
-                f"🕒 Fix Time               {fix_time_str}\n"
-                f"📍 Distancia              {total_distance} km\n"
-                f"🔋 Nivel de la batería    {battery_level}%\n"
-                f"🔋 Voltaje de la batería  {battery} V\n"
-                f"🚗 Movimiento             {motion_status}\n"
-                f"```"
-            )
+            positions = fetch_positions(client, devices)
+            statuses = device_statuses(client, devices)
+
+            if len(devices) == 1 and devices[0]["id"] not in positions:
+                content = f"⚠️ El dispositivo '{devices[0]['name']}' aún no tiene posiciones registradas."
+            elif len(devices) == 1:
+                position = positions[devices[0]["id"]]
+                attributes = position.get("attributes", {})
+                battery_level = attributes.get("batteryLevel", "No disponible")
+                battery = attributes.get("battery", "No disponible")
+                total_distance = round(attributes.get("totalDistance", 0) / 1000, 2)
+
+                motion = attributes.get("motion", False)
+                motion_status = "🟢 En movimiento" if motion else "🔴 Detenido"
+
+                content = (
+                    f"📡 Estado del dispositivo '{devices[0]['name']}':\n"
+                    f"```\n"
+                    f"🕒 Fix Time               {format_fix_time(position.get('fixTime'))}\n"
+                    f"📍 Distancia              {total_distance} km\n"
+                    f"🔋 Nivel de la batería    {battery_level}%\n"
+                    f"🔋 Voltaje de la batería  {battery} V\n"
+                    f"🚗 Movimiento             {motion_status}\n"
+                    f"📶 Conexión               {CONNECTION_LABELS.get(statuses.get(devices[0]['id']), 'No disponible')}\n"
+                    f"```"
+                )
+            else:
+                rows = []
+                for d in devices:
+                    position = positions.get(d["id"])
+                    connection = CONNECTION_LABELS.get(statuses.get(d["id"]), "-").split(" ")[0]
+                    if position is None:
+                        rows.append([d["name"], "-", "-", connection, "sin posición"])
+                        continue
+                    attributes = position.get("attributes", {})
+                    battery_level = attributes.get("batteryLevel")
+                    rows.append([
+                        d["name"],
+                        f"{battery_level}%" if battery_level is not None else "-",
+                        "🟢" if attributes.get("motion", False) else "🔴",
+                        connection,
+                        format_fix_time(position.get("fixTime")),
+                    ])
+                content = f"📡 Estado de {len(devices)} dispositivos:\n" + format_table(
+                    ["Dispositivo", "Batería", "Mov.", "Con.", "Fix Time"], rows
+                )
     except Exception as e:
-        print("❌ Error:", e)
+        error_logger.error(f"❌ Error en handle_status: {e}", exc_info=True, extra={"node": "handle_status"})
         content = "Error al obtener el estado del dispositivo."
 
-    return {"messages": [{"role": "assistant", "content": content}]}
+    return remember_devices({"messages": [{"role": "assistant", "content": content}]}, devices)
 
 def handle_list(state: State, config):
-    print("📋 Handling list devices query...")
+    bot_logger.debug("📋 Handling list devices query...", extra={"node": "handle_list"})
 
-     # 🔐 Obtén credenciales personalizadas desde el config
-    traccar_username = config["configurable"].get("traccar_username")
-    traccar_password = config["configurable"].get("traccar_password")
+    # 🔐 Cliente Traccar de la cuenta del usuario (main.py pasa la cuenta en el config; no se guarda en la memoria)
+    client = account_client(config)
 
-    if not traccar_username or not traccar_password:
+    if client is None:
         return {"messages": [{"role": "assistant", "content": "⚠️ No se configuraron credenciales para Traccar."}]}
 
     
 
     try:
-        response = requests.get(
-            f"{TRACCAR_URL}/api/devices",
-            auth=HTTPBasicAuth(traccar_username, traccar_password)
-        )
-        response.raise_for_status()
-        devices = response.json()
+        devices = device_cache.get(client)
 
         if not devices:
             content = "No se encontraron dispositivos registrados."
@@ -271,7 +492,7 @@ def handle_list(state: State, config):
             content = "\n".join(lines)
 
     except Exception as e:
-        print("❌ Error:", e)
+        error_logger.error(f"❌ Error en handle_list: {e}", exc_info=True, extra={"node": "handle_list"})
         content = "Ocurrió un error al obtener la lista de dispositivos."
 
     return {
@@ -280,29 +501,109 @@ def handle_list(state: State, config):
         ]
     }
 
+def _report_request(state: State, config):
+    """(cliente, dispositivos, inicio, fin, etiqueta) o un mensaje de error para el usuario."""
+    client = account_client(config)
+    if client is None:
+        return None, "⚠️ No se configuraron credenciales para Traccar."
+    user_message = state["messages"][-1].content
+    devices = resolve_devices(client, reports.strip_period(user_message), state.get("last_devices", []))
+    if not devices:
+        return None, "No encontré un dispositivo que coincida con tu mensaje."
+    period = reports.parse_period(user_message)
+    if period is None:
+        return None, f"⚠️ No reconozco el periodo de tu mensaje. {reports.PERIODS_HELP}"
+    start, end, label = period
+    return (client, devices[:MAX_TABLE_ROWS], start, end, label), None
+
+def handle_route(state: State, config):
+    bot_logger.debug("🛣️ Handling route report...", extra={"node": "handle_route"})
+    request, content = _report_request(state, config)
+    if request is None:
+        return {"messages": [{"role": "assistant", "content": content}]}
+    client, devices, start, end, label = request
+    update = {}
+    try:
+        # Las posiciones se parsean y agregan por bloques a medida que llegan
+        summaries = reports.summarize_route(client.iter_report("route", [d["id"] for d in devices], start, end))
+        content = reports.format_route(devices, summaries, label)
+        if reports.GPX_PATTERN.search(normalize(state["messages"][-1].content)) and summaries:
+            path = reports.write_gpx(devices, summaries, label)
+            update["attachment"] = {"path": path, "filename": f"ruta-{start:%Y%m%d}.gpx"}
+    except Exception as e:
+        error_logger.error(f"❌ Error en handle_route: {e}", exc_info=True, extra={"node": "handle_route"})
+        content = "Error al obtener el recorrido del dispositivo."
+    update["messages"] = [{"role": "assistant", "content": content}]
+    return remember_devices(update, devices)
+
+def handle_trips(state: State, config):
+    bot_logger.debug("🚚 Handling trips report...", extra={"node": "handle_trips"})
+    request, content = _report_request(state, config)
+    if request is None:
+        return {"messages": [{"role": "assistant", "content": content}]}
+    client, devices, start, end, label = request
+    try:
+        trips = reports.summarize_events(
+            client.iter_report("trips", [d["id"] for d in devices], start, end), ("distance", "duration", "maxSpeed")
+        )
+        content = reports.format_trips(devices, trips, label)
+    except Exception as e:
+        error_logger.error(f"❌ Error en handle_trips: {e}", exc_info=True, extra={"node": "handle_trips"})
+        content = "Error al obtener los viajes del dispositivo."
+    return remember_devices({"messages": [{"role": "assistant", "content": content}]}, devices)
+
+def handle_stops(state: State, config):
+    bot_logger.debug("🅿️ Handling stops report...", extra={"node": "handle_stops"})
+    request, content = _report_request(state, config)
+    if request is None:
+        return {"messages": [{"role": "assistant", "content": content}]}
+    client, devices, start, end, label = request
+    try:
+        stops = reports.summarize_events(client.iter_report("stops", [d["id"] for d in devices], start, end), ("duration",))
+        content = reports.format_stops(devices, stops, label)
+    except Exception as e:
+        error_logger.error(f"❌ Error en handle_stops: {e}", exc_info=True, extra={"node": "handle_stops"})
+        content = "Error al obtener las paradas del dispositivo."
+    return remember_devices({"messages": [{"role": "assistant", "content": content}]}, devices)
+
 def handle_ask(state: State):
     user_text = state["messages"][-1].content
     try:
-        answer = qa_chain.run(user_text)
+        answer = answer_cache.get_exact(user_text)
+        if answer is None:
+            # Un solo embedding sirve para el caché semántico y para la búsqueda en Chroma
+            with span(EMBEDDINGS_BACKEND, "embed_query"):
+                vector = get_embeddings().embed_query(user_text)
+            answer = answer_cache.get_similar(vector)
+            if answer is None:
+                with span("chroma", "similarity_search"):
+                    docs = get_vectordb().similarity_search_by_vector(vector)
+                with span("openai", "rag_completion"):
+                    answer = get_qa_chain().combine_documents_chain.run(input_documents=docs, question=user_text)
+                answer_cache.put(user_text, vector, answer)
+        bot_logger.info(f"[RAG] Caché de respuestas: {answer_cache.stats()}")
         content = answer
     except Exception as e:
-        error_logger.error(f"RAG error: {e}", exc_info=True)
+        error_logger.error(f"RAG error: {e}", exc_info=True, extra={"node": "handle_ask"})
         content = "Lo siento, no pude recuperar esa información ahora."
     return {"messages":[{"role":"assistant","content":content}]}
     
 def handle_ignore(state: State):
-    print("🚫 Handling ignored query...")
+    bot_logger.debug("🚫 Handling ignored query...", extra={"node": "handle_ignore"})
     return {"messages": [{"role": "assistant", "content": "Lo siento, no entendí tu consulta. Puedes preguntarme por la ubicación, velocidad o estado de un dispositivo."}]}
 
 # === 🧩 Build LangGraph ===
 agent_graph = StateGraph(State)
-agent_graph.add_node("triage_router", triage_router)
-agent_graph.add_node("handle_location", handle_location)
-agent_graph.add_node("handle_speed", handle_speed)
-agent_graph.add_node("handle_status", handle_status)
-agent_graph.add_node("handle_list", handle_list)
-agent_graph.add_node("handle_ask", handle_ask)
-agent_graph.add_node("handle_ignore", handle_ignore)
+agent_graph.add_node("triage_router", traced("triage_router")(triage_router))
+agent_graph.add_node("handle_location", traced("handle_location")(handle_location))
+agent_graph.add_node("handle_speed", traced("handle_speed")(handle_speed))
+agent_graph.add_node("handle_status", traced("handle_status")(handle_status))
+agent_graph.add_node("handle_list", traced("handle_list")(handle_list))
+agent_graph.add_node("handle_ask", traced("handle_ask")(handle_ask))
+agent_graph.add_node("handle_route", traced("handle_route")(handle_route))
+agent_graph.add_node("handle_trips", traced("handle_trips")(handle_trips))
+agent_graph.add_node("handle_stops", traced("handle_stops")(handle_stops))
+agent_graph.add_node("handle_ignore", traced("handle_ignore")(handle_ignore))
 
 agent_graph.add_edge(START, "triage_router")
 agent_graph.add_edge("handle_location", END)
@@ -310,6 +611,15 @@ agent_graph.add_edge("handle_speed", END)
 agent_graph.add_edge("handle_status", END)
 agent_graph.add_edge("handle_list", END)
 agent_graph.add_edge("handle_ask", END)
+agent_graph.add_edge("handle_route", END)
+agent_graph.add_edge("handle_trips", END)
+agent_graph.add_edge("handle_stops", END)
 agent_graph.add_edge("handle_ignore", END)
 
-agent = agent_graph.compile()
+# === 📊 Métricas de cachés y triage (se leen en cada scrape de /metrics) ===
+register_gauge("trakii_triage_total", "Triage decisions by path", triage_stats.as_dict)
+register_gauge("trakii_answer_cache", "RAG answer cache stats", answer_cache.stats)
+register_gauge("trakii_embeddings_cache", "Embedding cache stats",
+               lambda: {"hits": get_embeddings().hits, "misses": get_embeddings().misses} if "embeddings" in _singletons else {})
+register_gauge("trakii_single_flight_shared", "Calls served by an identical in-flight call", lambda: single_flight.shared)
+register_gauge("trakii_device_cache", "Device list cache stats", lambda: {"hits": device_cache.hits, "misses": device_cache.misses})
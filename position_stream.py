@@ -0,0 +1,175 @@
+import json
+import os
+import random
+import threading
+import time
+
+from log_config import bot_logger, error_logger
+
+try:
+    import websocket  # websocket-client (opcional)
+except ImportError:
+    websocket = None
+
+# === Configuración del stream de posiciones ===
+POSITION_STREAM_ENABLED = os.getenv("POSITION_STREAM_ENABLED", "false").lower() in ("1", "true", "yes")
+# Se cierra el socket de una cuenta tras este tiempo sin consultas
+POSITION_STREAM_IDLE = float(os.getenv("POSITION_STREAM_IDLE", "1800"))
+POSITION_STREAM_MAX_BACKOFF = float(os.getenv("POSITION_STREAM_MAX_BACKOFF", "60"))
+
+if POSITION_STREAM_ENABLED and websocket is None:
+    error_logger.error("[SOCKET] POSITION_STREAM_ENABLED sin websocket-client instalado: se usará solo HTTP")
+
+
+class PositionStream:
+    """Tabla en memoria de la última posición y estado de cada dispositivo de una cuenta.
+
+    Se alimenta del WebSocket `/api/socket` de Traccar en un hilo propio, con
+    reconexión y backoff exponencial. Solo se consideran válidos los datos
+    mientras el socket está conectado; si no, los handlers vuelven a HTTP.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.positions: dict = {}       # deviceId -> posición
+        self.device_status: dict = {}   # deviceId -> {"status", "lastUpdate"}
+        self.connected = False
+        self.last_used = time.monotonic()
+        self._ws = None
+        self._opened = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"trakii-socket-{client.username}", daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        base = self.client.base_url
+        if base.startswith("https://"):
+            base = "wss://" + base[len("https://"):]
+        elif base.startswith("http://"):
+            base = "ws://" + base[len("http://"):]
+        return f"{base}/api/socket"
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._ws is not None:
+            self._ws.close()
+
+    def latest(self, device_ids) -> dict:
+        """Posiciones conocidas de los dispositivos pedidos (vacío si no hay conexión)."""
+        self.last_used = time.monotonic()
+        if not self.connected:
+            return {}
+        return {i: self.positions[i] for i in device_ids if i in self.positions}
+
+    def statuses(self, device_ids) -> dict:
+        """Estado de conexión ("online", "offline", "unknown") recibido por el socket (vacío si no hay conexión)."""
+        self.last_used = time.monotonic()
+        if not self.connected:
+            return {}
+        return {i: self.device_status[i]["status"] for i in device_ids if i in self.device_status}
+
+    # === 🔌 Bucle de conexión ===
+    def _run(self):
+        attempt = 0
+        while not self._stopped.is_set():
+            try:
+                cookie = self.client.session_cookie()
+                self._ws = websocket.WebSocketApp(
+                    self.url,
+                    header=[f"Cookie: {cookie}"],
+                    on_open=self._on_open,
+                    on_message=self._on_message,
+                    on_error=self._on_error,
+                    on_close=self._on_close,
+                )
+                self._opened = False
+                self._ws.run_forever(ping_interval=30, ping_timeout=10)
+                if self._opened:
+                    attempt = 0
+            except Exception as e:
+                error_logger.error(f"[SOCKET] Error en el stream de {self.client.username}: {e}")
+            finally:
+                self.connected = False
+
+            if self._stopped.is_set():
+                break
+            delay = min(POSITION_STREAM_MAX_BACKOFF, 2 ** attempt) * (0.5 + random.random() / 2)
+            attempt += 1
+            bot_logger.info(f"[SOCKET] Reconectando {self.client.username} en {delay:.1f}s")
+            self._stopped.wait(delay)
+
+    def _on_open(self, ws):
+        self._opened = True
+        self.connected = True
+        bot_logger.info(f"[SOCKET] Conectado a {self.url} ({self.client.username})")
+
+    def _on_message(self, ws, message):
+        data = json.loads(message)
+        for device in data.get("devices", []):
+            self.device_status[device["id"]] = {
+                "status": device.get("status"),
+                "lastUpdate": device.get("lastUpdate"),
+            }
+        for position in data.get("positions", []):
+            self.positions[position["deviceId"]] = position
+
+    def _on_error(self, ws, error):
+        status = getattr(error, "status_code", None)
+        if status == 401:
+            # La cookie caducó: se renueva la sesión en el siguiente intento
+            self.client.expire_session()
+        error_logger.error(f"[SOCKET] {self.client.username}: {error}")
+
+    def _on_close(self, ws, status_code, reason):
+        self.connected = False
+
+
+# === Registro de streams (uno por cuenta activa) ===
+_streams: dict = {}
+_streams_lock = threading.Lock()
+
+
+def get_stream(client):
+    """Stream de la cuenta, arrancado en el primer uso; None si está deshabilitado."""
+    if not POSITION_STREAM_ENABLED or websocket is None:
+        return None
+    key = (client.base_url, client.username)
+    with _streams_lock:
+        _close_idle()
+        stream = _streams.get(key)
+        if stream is None:
+            stream = PositionStream(client)
+            _streams[key] = stream
+            stream.start()
+        return stream
+
+
+def stop_stream(client):
+    """Cierra el stream que usa ese cliente (p. ej. al cambiar la contraseña de la cuenta)."""
+    key = (client.base_url, client.username)
+    with _streams_lock:
+        stream = _streams.get(key)
+        if stream is not None and stream.client is client:
+            stream.stop()
+            del _streams[key]
+
+
+def _close_idle():
+    now = time.monotonic()
+    for key, stream in list(_streams.items()):
+        if now - stream.last_used > POSITION_STREAM_IDLE:
+            bot_logger.info(f"[SOCKET] Cerrando stream inactivo de {stream.client.username}")
+            stream.stop()
+            del _streams[key]
+
+
+def stop_all():
+    with _streams_lock:
+        for stream in _streams.values():
+            stream.stop()
+        _streams.clear()
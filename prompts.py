@@ -17,7 +17,10 @@ Your job is to classify the following message into one of four categories:
 3. status - When the user asks for device status (online, battery, last update)
 4. list - When the user requests to see all registered devices or a list of them
 5. ask - When the user asks general questions (Who is Trakii, what can you do, how does it work?)
-6. ignore - When the user ask whatever that is not related to the previus detailed categories
+6. route - When the user asks about a past route or distance traveled over a period (today, yesterday, this week)
+7. trips - When the user asks about the trips of a device over a period
+8. stops - When the user asks about the stops of a device over a period
+9. ignore - When the user ask whatever that is not related to the previus detailed categories
 
 Classify the below message into one of these categories.
 
@@ -31,6 +34,9 @@ When the input messages comes on Spanish you have to answer ALWAYS on Spanish
 - Status: {triage_status}
 - List: {triage_list}
 - Ask: {triage_ask}
+- Route: {triage_route}
+- Trips: {triage_trips}
+- Stops: {triage_stops}
 - Ignore: {triage_no}
 
 </ Rules >
@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from shared_state import get_shared_state
+
+# === Límites por defecto (consultas por minuto y ráfaga máxima) ===
+USER_RATE_PER_MINUTE = float(os.getenv("USER_RATE_PER_MINUTE", "20"))
+USER_BURST = float(os.getenv("USER_BURST", "5"))
+ACCOUNT_RATE_PER_MINUTE = float(os.getenv("ACCOUNT_RATE_PER_MINUTE", "120"))
+ACCOUNT_BURST = float(os.getenv("ACCOUNT_BURST", "20"))
+
+
+def _refill(tokens: float, updated_at: float, now: float, rate_per_minute: float, burst: float) -> float:
+    return min(burst, tokens + (now - updated_at) * rate_per_minute / 60.0)
+
+
+class RateLimiter:
+    """Token bucket por clave (usuario de Telegram o cuenta Traccar), en memoria."""
+
+    def __init__(self, rate_per_minute: float, burst: float, max_keys: int = 10000):
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: OrderedDict = OrderedDict()  # clave -> [tokens, updated_at]
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def allow(self, key, rate_per_minute: float = None, burst: float = None) -> bool:
+        # Un 0 explícito es válido (cuenta bloqueada): solo None usa el valor por defecto
+        rate = self.rate_per_minute if rate_per_minute is None else rate_per_minute
+        burst = self.burst if burst is None else burst
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            bucket[0] = _refill(bucket[0], bucket[1], now, rate, burst)
+            bucket[1] = now
+            if bucket[0] < 1:
+                self.rejected += 1
+                return False
+            bucket[0] -= 1
+            return True
+
+
+class SharedRateLimiter:
+    """Mismo token bucket, guardado en SharedState para que lo compartan todos los workers."""
+
+    def __init__(self, rate_per_minute: float, burst: float, prefix: str = "ratelimit"):
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.prefix = prefix
+        self.rejected = 0
+
+    def allow(self, key, rate_per_minute: float = None, burst: float = None) -> bool:
+        # Un 0 explícito es válido (cuenta bloqueada): solo None usa el valor por defecto
+        rate = self.rate_per_minute if rate_per_minute is None else rate_per_minute
+        burst = self.burst if burst is None else burst
+        allowed = []
+
+        def take(bucket):
+            now = time.time()
+            tokens = burst if bucket is None else _refill(bucket["tokens"], bucket["updated_at"], now, rate, burst)
+            allowed.append(tokens >= 1)
+            return {"tokens": tokens - 1 if tokens >= 1 else tokens, "updated_at": now}
+
+        # El bucket caduca cuando ya se habría rellenado por completo
+        get_shared_state().update(f"{self.prefix}:{key}", take, ttl=burst * 60.0 / rate + 60 if rate > 0 else None)
+        if not allowed[0]:
+            self.rejected += 1
+        return allowed[0]
+
+
+class SingleFlight:
+    """Agrupa llamadas idénticas en curso: la primera ejecuta, las demás esperan su resultado."""
+
+    def __init__(self):
+        self._calls: dict = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+            else:
+                self.shared += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,156 @@
+import asyncio
+import os
+import time
+
+from telegram.constants import ChatAction
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from log_config import error_logger
+from metrics import span
+
+# === Configuración de respuestas en streaming ===
+STREAMING_REPLIES = os.getenv("STREAMING_REPLIES", "true").lower() in ("1", "true", "yes")
+# Segundos mínimos entre ediciones del mismo mensaje (Telegram limita las ediciones por chat)
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+STREAM_PLACEHOLDER = "✍️ ..."
+STREAM_CURSOR = " ▌"
+# Nodos cuyos tokens de LLM se muestran al usuario (el router produce JSON, no texto)
+STREAMED_NODES = ("handle_ask",)
+TELEGRAM_MAX_LENGTH = 4096
+# El indicador "escribiendo..." desaparece a los ~5 s: se renueva antes
+TYPING_REFRESH = 4.0
+
+
+def retry_seconds(retry_after) -> float:
+    # PTB devuelve int o timedelta según la versión
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
+
+class StreamingReply:
+    """Respuesta de Telegram que se muestra mientras se genera.
+
+    Muestra "escribiendo..." hasta que hay algo que enseñar, envía un mensaje
+    provisional y lo edita con el texto acumulado como máximo una vez cada
+    `edit_interval` segundos. `finish` deja el texto final con formato Markdown.
+    """
+
+    def __init__(self, message, edit_interval: float = STREAM_EDIT_INTERVAL):
+        self.message = message
+        self.edit_interval = edit_interval
+        self.sent = None          # mensaje provisional que se va editando
+        self.text = ""
+        self.shown = ""
+        self.next_edit_at = 0.0
+        self.first_visible_at = None
+        self._typing = None
+
+    # --- Indicador "escribiendo..." ---
+    def start_typing(self):
+        self._typing = asyncio.create_task(self._keep_typing())
+
+    async def _keep_typing(self):
+        while True:
+            try:
+                await self.message.reply_chat_action(ChatAction.TYPING)
+            except TelegramError as e:
+                error_logger.error(f"[STREAM] No se pudo enviar la acción de escritura: {e}")
+                return
+            await asyncio.sleep(TYPING_REFRESH)
+
+    def stop_typing(self):
+        if self._typing is not None:
+            self._typing.cancel()
+            self._typing = None
+
+    # --- Mensaje provisional y ediciones ---
+    async def placeholder(self):
+        if self.sent is None:
+            self.stop_typing()
+            with span("telegram", "send_placeholder"):
+                self.sent = await self.message.reply_text(STREAM_PLACEHOLDER)
+            self.shown = STREAM_PLACEHOLDER
+            self.next_edit_at = time.monotonic() + self.edit_interval
+            self._visible()
+
+    async def push(self, token: str):
+        self.text += token
+        if self.sent is None:
+            await self.placeholder()
+        elif time.monotonic() >= self.next_edit_at:
+            preview = self.text
+            if len(preview) + len(STREAM_CURSOR) > TELEGRAM_MAX_LENGTH:
+                preview = preview[:TELEGRAM_MAX_LENGTH - len(STREAM_CURSOR) - 1] + "…"
+            # Sin parse_mode: el Markdown a medio escribir suele ser inválido
+            await self._edit(preview + STREAM_CURSOR)
+
+    async def _edit(self, text: str, parse_mode: str = None) -> bool:
+        if text == self.shown:
+            return True
+        try:
+            with span("telegram", "edit_message_text"):
+                await self.sent.edit_text(text, parse_mode=parse_mode)
+        except RetryAfter as e:
+            # Se salta esta edición; la siguiente lleva todo el texto acumulado
+            self.next_edit_at = time.monotonic() + retry_seconds(e.retry_after)
+            return False
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+        self.shown = text
+        self.next_edit_at = time.monotonic() + self.edit_interval
+        return True
+
+    async def finish(self, text: str):
+        self.stop_typing()
+        if self.sent is None:
+            with span("telegram", "reply_text"):
+                await self.message.reply_text(text, parse_mode="Markdown")
+            self._visible()
+            return
+        try:
+            delivered = await self._edit(text, parse_mode="Markdown")
+        except BadRequest:
+            # Markdown inválido en la respuesta del LLM: se deja como texto plano
+            delivered = await self._edit(text)
+        while not delivered:
+            await asyncio.sleep(max(0.0, self.next_edit_at - time.monotonic()))
+            delivered = await self._edit(text)
+
+    def _visible(self):
+        if self.first_visible_at is None:
+            self.first_visible_at = time.perf_counter()
+
+
+async def iter_agent_stream(pool, user_id, graph, state_input: dict, config: dict):
+    """Ejecuta `graph.stream` en el pool del agente y entrega sus eventos (modo, dato) al event loop."""
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def produce():
+        for event in graph.stream(state_input, config=config, stream_mode=["values", "updates", "messages"]):
+            loop.call_soon_threadsafe(events.put_nowait, event)
+
+    task = asyncio.ensure_future(pool.run(user_id, produce))
+    # Los eventos se encolan antes de que termine la tarea: None marca el final
+    task.add_done_callback(lambda _: events.put_nowait(None))
+    while (event := await events.get()) is not None:
+        yield event
+    await task  # propaga los errores del grafo
+
+
+async def run_streaming(pool, user_id, graph, state_input: dict, config: dict, reply: StreamingReply) -> dict:
+    """Ejecuta el agente mostrando los tokens de los nodos RAG a medida que llegan; devuelve el estado final."""
+    result = {}
+    async for mode, chunk in iter_agent_stream(pool, user_id, graph, state_input, config):
+        if mode == "values":
+            # Con checkpointer, los primeros "values" del turno traen aún la clasificación del turno anterior
+            result = chunk
+        elif mode == "updates":
+            # La clasificación de este turno ya indica una respuesta larga: provisional sin esperar al primer token
+            if (chunk.get("triage_router") or {}).get("classification") == "ask":
+                await reply.placeholder()
+        else:
+            message, metadata = chunk
+            if metadata.get("langgraph_node") in STREAMED_NODES and message.content:
+                await reply.push(message.content)
+    return result
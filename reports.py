@@ -0,0 +1,306 @@
+import os
+import re
+import tempfile
+from datetime import datetime, timedelta, timezone
+from xml.sax.saxutils import escape
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from device_resolver import normalize
+
+# === Configuración de informes (ruta, viajes, paradas) ===
+REPORTS_TIMEZONE = ZoneInfo(os.getenv("REPORTS_TIMEZONE", "UTC"))
+# Rango máximo que se pide a Traccar de una vez
+REPORTS_MAX_DAYS = int(os.getenv("REPORTS_MAX_DAYS", "31"))
+# Puntos que se acumulan por dispositivo antes de procesarlos con NumPy
+REPORT_CHUNK_POINTS = int(os.getenv("REPORT_CHUNK_POINTS", "5000"))
+# Puntos que se conservan por dispositivo para el GPX (se diezma uniformemente)
+REPORT_MAX_TRACK_POINTS = int(os.getenv("REPORT_MAX_TRACK_POINTS", "5000"))
+REPORTS_DIR = os.getenv("REPORTS_DIR", "state/reports")
+# Por encima de esta velocidad (nudos) el dispositivo se considera en movimiento
+MOVING_SPEED_KN = 2.0
+KNOTS_TO_KPH = 1.852
+EARTH_RADIUS_M = 6371008.8
+MAX_REPORT_ROWS = 10
+
+# Pide el recorrido como archivo ("mándame el gpx de ayer")
+GPX_PATTERN = re.compile(r"\b(gpx|archivo|descargar|exportar|download|export)\b")
+
+
+# === 🗓️ Periodo pedido en el mensaje ===
+# Expresiones de periodo que reconoce parse_period (sobre el texto original, con o sin acentos)
+PERIOD_PATTERN = re.compile(
+    r"\b(?:(?:(?:[uú]ltim[oa]s?|last|past)\s+\d+\s+(?:horas?|hours?|h|d[ií]as|days))"
+    r"|anteayer|antier|ayer|yesterday|semana\s+pasada|last\s+week|esta\s+semana|this\s+week|semana|week"
+    r"|hoy|today)\b",
+    re.IGNORECASE,
+)
+# Menciones de periodo que parse_period no sabe interpretar (sobre el texto normalizado):
+# rangos ("desde el lunes"), meses, días de la semana, fechas... Mejor avisar que informar de hoy
+UNSUPPORTED_PERIOD_PATTERN = re.compile(
+    r"\b(desde|since|hasta|until|entre|between|mes|meses|month|months|ano|anos|year|years"
+    r"|lunes|martes|miercoles|jueves|viernes|sabado|domingo"
+    r"|monday|tuesday|wednesday|thursday|friday|saturday|sunday"
+    r"|enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|setiembre|octubre|noviembre|diciembre"
+    r"|january|february|april|june|july|august|september|october|november|december"
+    r"|anoche|manana|tomorrow|fecha|date)\b"
+)
+DATE_PATTERN = re.compile(r"\b\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?\b")
+RANGE_PATTERN = re.compile(r"\b(desde|since|hasta|until|entre|between)\b")
+PERIODS_HELP = (
+    "Periodos disponibles: hoy, ayer, anteayer, esta semana, la semana pasada, "
+    "últimas N horas y últimos N días (hasta " + str(REPORTS_MAX_DAYS) + " días)."
+)
+
+
+def strip_period(message: str) -> str:
+    """Mensaje sin la expresión de periodo, para no leer sus números como dispositivos."""
+    return PERIOD_PATTERN.sub(" ", message)
+
+
+def parse_period(message: str, now: datetime = None):
+    """(inicio, fin, etiqueta) del periodo mencionado; hoy si no se menciona ninguno.
+
+    None si el mensaje menciona un periodo que no se sabe interpretar ("el mes
+    pasado", "desde el lunes", "15/03"): el handler responde con PERIODS_HELP.
+    """
+    now = now or datetime.now(REPORTS_TIMEZONE)
+    text = normalize(message)
+    # Los rangos ("desde ayer") no se pueden reducir a un periodo conocido sin cambiar su sentido
+    if RANGE_PATTERN.search(text):
+        return None
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    monday = midnight - timedelta(days=midnight.weekday())
+
+    if m := re.search(r"\b(?:ultim[oa]s?|last|past) (\d+) (?:horas?|hours?|h)\b", text):
+        hours = int(m.group(1))
+        start, end, label = now - timedelta(hours=hours), now, f"últimas {hours} h"
+    elif m := re.search(r"\b(?:ultimos|last|past) (\d+) (?:dias|days)\b", text):
+        days = int(m.group(1))
+        start, end, label = now - timedelta(days=days), now, f"últimos {days} días"
+    elif re.search(r"\b(anteayer|antier)\b", text):
+        start, end, label = midnight - timedelta(days=2), midnight - timedelta(days=1), "anteayer"
+    elif re.search(r"\b(ayer|yesterday)\b", text):
+        start, end, label = midnight - timedelta(days=1), midnight, "ayer"
+    elif re.search(r"\b(semana pasada|last week)\b", text):
+        start, end, label = monday - timedelta(days=7), monday, "la semana pasada"
+    elif re.search(r"\b(esta semana|this week|semana|week)\b", text):
+        start, end, label = monday, now, "esta semana"
+    elif re.search(r"\b(hoy|today)\b", text):
+        start, end, label = midnight, now, "hoy"
+    elif UNSUPPORTED_PERIOD_PATTERN.search(text) or DATE_PATTERN.search(message):
+        return None
+    else:
+        start, end, label = midnight, now, "hoy"
+
+    if end - start > timedelta(days=REPORTS_MAX_DAYS):
+        start = end - timedelta(days=REPORTS_MAX_DAYS)
+    return start, end, label
+
+
+# === 📐 Agregación vectorizada ===
+def haversine_m(lat1, lon1, lat2, lon2) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def _timestamp(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class RouteSummary:
+    """Distancia, velocidad máxima y tiempo en movimiento de un dispositivo, por bloques de puntos.
+
+    Solo guarda el último punto de cada bloque (para enlazar con el siguiente) y
+    un recorrido diezmado de como mucho `max_track_points` puntos.
+    """
+
+    def __init__(self, max_track_points: int = REPORT_MAX_TRACK_POINTS):
+        self.points = 0
+        self.distance_m = 0.0
+        self.max_speed_kn = 0.0
+        self.moving_s = 0.0
+        self.start_time = None
+        self.end_time = None
+        self.max_track_points = max_track_points
+        self.track = []        # (lat, lon, timestamp) cada `_stride` puntos
+        self._stride = 1
+        self._last = None      # último punto del bloque anterior
+
+    def add(self, lat: np.ndarray, lon: np.ndarray, speed: np.ndarray, times: np.ndarray):
+        if not len(lat):
+            return
+        if self.start_time is None:
+            self.start_time = times[0]
+        self.end_time = times[-1]
+        self.max_speed_kn = max(self.max_speed_kn, float(speed.max()))
+        self._decimate(lat, lon, times)
+        self.points += len(lat)
+
+        if self._last is not None:
+            last_lat, last_lon, last_time = self._last
+            lat, lon = np.r_[last_lat, lat], np.r_[last_lon, lon]
+            times, speed = np.r_[last_time, times], np.r_[0.0, speed]
+        self._last = (lat[-1], lon[-1], times[-1])
+        if len(lat) < 2:
+            return
+        self.distance_m += float(haversine_m(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum())
+        # Tiempo entre puntos consecutivos cuando el segundo va por encima del umbral
+        gaps = np.diff(times)
+        self.moving_s += float(gaps[speed[1:] > MOVING_SPEED_KN].sum())
+
+    def _decimate(self, lat, lon, times):
+        offset = (-self.points) % self._stride
+        for i in range(offset, len(lat), self._stride):
+            self.track.append((float(lat[i]), float(lon[i]), float(times[i])))
+        while len(self.track) > self.max_track_points:
+            # Se conserva uno de cada dos puntos y se duplica el paso
+            self.track = self.track[::2]
+            self._stride *= 2
+
+    @property
+    def distance_km(self) -> float:
+        return round(self.distance_m / 1000, 1)
+
+    @property
+    def max_speed_kph(self) -> float:
+        return round(self.max_speed_kn * KNOTS_TO_KPH, 1)
+
+    @property
+    def avg_moving_speed_kph(self) -> float:
+        return round(self.distance_m / self.moving_s * 3.6, 1) if self.moving_s else 0.0
+
+
+def summarize_route(positions, chunk_points: int = REPORT_CHUNK_POINTS) -> dict:
+    """RouteSummary por deviceId a partir de un iterable de posiciones (en orden de tiempo)."""
+    summaries: dict = {}
+    buffers: dict = {}
+
+    def flush(device_id):
+        lat, lon, speed, times = zip(*buffers.pop(device_id))
+        summary = summaries.setdefault(device_id, RouteSummary())
+        summary.add(np.array(lat), np.array(lon), np.array(speed), np.array(times))
+
+    for p in positions:
+        if p.get("valid") is False:
+            continue
+        device_id = p["deviceId"]
+        buffer = buffers.setdefault(device_id, [])
+        buffer.append((p["latitude"], p["longitude"], p.get("speed") or 0.0, _timestamp(p["fixTime"])))
+        if len(buffer) >= chunk_points:
+            flush(device_id)
+    for device_id in list(buffers):
+        flush(device_id)
+    return summaries
+
+
+def summarize_events(items, fields: tuple) -> dict:
+    """Por deviceId: arrays NumPy de los campos numéricos pedidos y las últimas MAX_REPORT_ROWS filas."""
+    columns: dict = {}
+    rows: dict = {}
+    for item in items:
+        device_id = item["deviceId"]
+        values = columns.setdefault(device_id, {f: [] for f in fields})
+        for f in fields:
+            values[f].append(item.get(f) or 0)
+        device_rows = rows.setdefault(device_id, [])
+        device_rows.append(item)
+        if len(device_rows) > MAX_REPORT_ROWS:
+            device_rows.pop(0)
+    return {
+        device_id: ({f: np.asarray(v, dtype=float) for f, v in values.items()}, rows[device_id])
+        for device_id, values in columns.items()
+    }
+
+
+# === 📝 Formato ===
+def format_duration(seconds: float) -> str:
+    minutes = int(round(seconds / 60))
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} h {minutes} min" if hours else f"{minutes} min"
+
+
+def format_time(value) -> str:
+    if isinstance(value, str):
+        value = _timestamp(value)
+    return datetime.fromtimestamp(value, REPORTS_TIMEZONE).strftime("%d/%m %H:%M")
+
+
+def format_route(devices: list, summaries: dict, label: str) -> str:
+    lines = [f"🛣️ Recorrido de {label}:"]
+    for d in devices:
+        s = summaries.get(d["id"])
+        if s is None or not s.points:
+            lines.append(f"- {d['name']}: sin posiciones en el periodo")
+            continue
+        lines.append(
+            f"- {d['name']}: {s.distance_km} km, vel. máx. {s.max_speed_kph} km/h, "
+            f"en movimiento {format_duration(s.moving_s)} (media {s.avg_moving_speed_kph} km/h), "
+            f"{format_time(s.start_time)} → {format_time(s.end_time)}"
+        )
+    return "\n".join(lines)
+
+
+def format_trips(devices: list, trips: dict, label: str) -> str:
+    lines = [f"🚚 Viajes de {label}:"]
+    for d in devices:
+        if d["id"] not in trips:
+            lines.append(f"- {d['name']}: sin viajes en el periodo")
+            continue
+        values, rows = trips[d["id"]]
+        lines.append(
+            f"- {d['name']}: {len(values['distance'])} viajes, {round(values['distance'].sum() / 1000, 1)} km, "
+            f"{format_duration(values['duration'].sum() / 1000)} de conducción, "
+            f"vel. máx. {round(values['maxSpeed'].max() * KNOTS_TO_KPH, 1)} km/h"
+        )
+        if len(devices) == 1:
+            for trip in rows:
+                lines.append(
+                    f"  • {format_time(trip['startTime'])} → {format_time(trip['endTime'])}: "
+                    f"{round((trip.get('distance') or 0) / 1000, 1)} km en {format_duration((trip.get('duration') or 0) / 1000)}"
+                )
+    return "\n".join(lines)
+
+
+def format_stops(devices: list, stops: dict, label: str) -> str:
+    lines = [f"🅿️ Paradas de {label}:"]
+    for d in devices:
+        if d["id"] not in stops:
+            lines.append(f"- {d['name']}: sin paradas en el periodo")
+            continue
+        values, rows = stops[d["id"]]
+        durations = values["duration"] / 1000
+        lines.append(
+            f"- {d['name']}: {len(durations)} paradas, {format_duration(durations.sum())} detenido, "
+            f"la más larga de {format_duration(durations.max())}"
+        )
+        if len(devices) == 1:
+            for stop in rows:
+                place = stop.get("address") or f"{stop.get('latitude')}, {stop.get('longitude')}"
+                lines.append(
+                    f"  • {format_time(stop['startTime'])} ({format_duration((stop.get('duration') or 0) / 1000)}): {place}"
+                )
+    return "\n".join(lines)
+
+
+# === 🗺️ GPX ===
+def write_gpx(devices: list, summaries: dict, label: str) -> str:
+    """Escribe un GPX con un track por dispositivo en REPORTS_DIR y devuelve su ruta."""
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="ruta-", suffix=".gpx", dir=REPORTS_DIR)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<gpx version="1.1" creator="TrakiiBot" xmlns="http://www.topografix.com/GPX/1/1">\n')
+        for d in devices:
+            summary = summaries.get(d["id"])
+            if summary is None or not summary.track:
+                continue
+            f.write(f"<trk><name>{escape(str(d['name']))} ({escape(label)})</name><trkseg>\n")
+            for lat, lon, ts in summary.track:
+                stamp = datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+                f.write(f'<trkpt lat="{lat:.6f}" lon="{lon:.6f}"><time>{stamp}</time></trkpt>\n')
+            f.write("</trkseg></trk>\n")
+        f.write("</gpx>\n")
+    return path
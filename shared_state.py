@@ -0,0 +1,105 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# === Estado compartido entre procesos (SQLite en modo WAL) ===
+# Lo usan los workers del modo webhook para cualquier dato que no deba vivir
+# solo en la memoria de un proceso.
+SHARED_STATE_DB = os.getenv("SHARED_STATE_DB", "state/trakii-state.db")
+
+
+class SharedState:
+    """Almacén clave/valor con TTL, seguro entre hilos y procesos."""
+
+    def __init__(self, path: str = SHARED_STATE_DB):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # Una conexión por hilo: sqlite3 no permite compartirlas
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, default=None):
+        row = self._connect().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key: str, value, ttl: float = None):
+        expires_at = time.time() + ttl if ttl else None
+        self._connect().execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), expires_at),
+        )
+
+    def add(self, key: str, value=True, ttl: float = None) -> bool:
+        """Guarda la clave solo si no existe (o caducó). True si se guardó."""
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM kv WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def update(self, key: str, fn, ttl: float = None):
+        """Lectura-modificación-escritura atómica: guarda y devuelve fn(valor_actual)."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, now)
+            ).fetchone()
+            value = fn(json.loads(row[0]) if row else None)
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl if ttl else None),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def delete(self, key: str):
+        self._connect().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def purge_expired(self):
+        self._connect().execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+
+_shared_state = None
+_shared_state_lock = threading.Lock()
+
+
+def get_shared_state() -> SharedState:
+    global _shared_state
+    with _shared_state_lock:
+        if _shared_state is None:
+            _shared_state = SharedState()
+        return _shared_state
@@ -0,0 +1,189 @@
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from log_config import bot_logger, error_logger
+from position_stream import stop_stream
+from traccar_client import close_client, get_client
+
+_ = load_dotenv()
+
+# === Registro de cuentas Traccar y usuarios de Telegram ===
+# Archivo JSON con "accounts" y "users" (ver tenants.json); se recarga al cambiar, sin reiniciar el bot
+TENANTS_FILE = os.getenv("TENANTS_FILE", "tenants.json")
+# Cada cuánto se comprueba si el archivo cambió
+TENANTS_RELOAD_INTERVAL = float(os.getenv("TENANTS_RELOAD_INTERVAL", "5"))
+
+
+class Account:
+    """Cuenta Traccar: la comparten todos sus usuarios de Telegram.
+
+    El cliente (sesión autenticada y pool de conexiones) se crea en el primer uso y
+    es uno por credencial, así que el caché de dispositivos, el socket de posiciones
+    y las peticiones agrupadas también se comparten entre los usuarios de la cuenta.
+    La contraseña no sale de aquí: handlers y grafo reciben el objeto Account.
+    """
+
+    __slots__ = ("key", "username", "_password", "rate_per_minute", "burst")
+
+    def __init__(self, key: str, username: str, password: str, rate_per_minute=None, burst=None):
+        self.key = key
+        self.username = username
+        self._password = password
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+
+    @property
+    def client(self):
+        return get_client(self.username, self._password)
+
+    def close(self):
+        """Cierra la sesión y el socket de la credencial (si se llegaron a abrir)."""
+        client = close_client(self.username, self._password)
+        if client is not None:
+            stop_stream(client)
+
+    def same_credentials(self, other: "Account") -> bool:
+        return (self.username, self._password) == (other.username, other._password)
+
+    def __repr__(self) -> str:
+        return f"Account({self.key!r}, {self.username!r})"
+
+
+class Tenant:
+    """Usuario de Telegram autorizado y su cuenta Traccar."""
+
+    __slots__ = ("user_id", "account", "rate_per_minute", "burst")
+
+    def __init__(self, user_id: int, account: Account, rate_per_minute=None, burst=None):
+        self.user_id = user_id
+        self.account = account
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+
+
+def _secret(entry: dict, field: str):
+    # "password_env": "TRACCAR_PASS_E2" lee la variable de entorno; "password" es el valor literal
+    if f"{field}_env" in entry:
+        return os.getenv(entry[f"{field}_env"])
+    return entry.get(field)
+
+
+def parse_tenants(data: dict, previous: dict = None) -> tuple:
+    """({clave: Account}, {user_id: Tenant}) a partir del contenido del archivo.
+
+    Las cuentas cuyas credenciales no cambian conservan el mismo objeto (y su sesión).
+    """
+    previous = previous or {}
+    accounts = {}
+    for key, entry in (data.get("accounts") or {}).items():
+        username, password = _secret(entry, "username"), _secret(entry, "password")
+        if not username or not password:
+            error_logger.error(f"[TENANTS] La cuenta '{key}' no tiene usuario o contraseña: se ignora")
+            continue
+        account = Account(key, username, password, entry.get("rate_per_minute"), entry.get("burst"))
+        old = previous.get(key)
+        if old is not None and old.same_credentials(account):
+            old.rate_per_minute, old.burst = account.rate_per_minute, account.burst
+            account = old
+        accounts[key] = account
+
+    tenants = {}
+    for user_id, entry in (data.get("users") or {}).items():
+        if isinstance(entry, str):
+            entry = {"account": entry}
+        account = accounts.get(entry.get("account"))
+        if account is None:
+            error_logger.error(f"[TENANTS] El usuario {user_id} apunta a una cuenta inexistente: '{entry.get('account')}'")
+            continue
+        tenants[int(user_id)] = Tenant(int(user_id), account, entry.get("rate_per_minute"), entry.get("burst"))
+    return accounts, tenants
+
+
+class TenantRegistry:
+    """Usuarios y cuentas leídos de TENANTS_FILE, recargados en caliente.
+
+    Se comprueba la fecha de modificación como mucho cada `reload_interval`
+    segundos; si el archivo nuevo no es válido se sigue usando el anterior.
+    """
+
+    def __init__(self, path: str = TENANTS_FILE, reload_interval: float = TENANTS_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.accounts: dict = {}
+        self.tenants: dict = {}
+        self.reloads = 0
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._maybe_reload(force=True)
+
+    def _maybe_reload(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            if not force and now - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                if self._mtime is not None or force:
+                    error_logger.error(f"[TENANTS] No se encuentra {self.path}: ningún usuario autorizado")
+                self._mtime = None
+                self.accounts, self.tenants = {}, {}
+                return
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    accounts, tenants = parse_tenants(json.load(f), self.accounts)
+            except (OSError, ValueError, AttributeError) as e:
+                error_logger.error(f"[TENANTS] {self.path} no es válido, se mantiene la configuración anterior: {e}")
+                self._mtime = mtime
+                return
+            self._mtime = mtime
+            # Sustitución atómica: los lectores ven la configuración anterior o la nueva, nunca una mezcla
+            previous, self.accounts, self.tenants = self.accounts, accounts, tenants
+            self._close_replaced(previous)
+            self.reloads += 1
+            bot_logger.info(f"[TENANTS] {len(tenants)} usuarios y {len(accounts)} cuentas cargados de {self.path}")
+
+    def _close_replaced(self, previous: dict):
+        # Cuentas eliminadas o con credenciales nuevas: su cliente (sesión y cookie) ya no se usa,
+        # salvo que otra cuenta vigente tenga las mismas credenciales
+        current = list(self.accounts.values())
+        for account in previous.values():
+            if any(a is account or a.same_credentials(account) for a in current):
+                continue
+            account.close()
+            bot_logger.info(f"[TENANTS] Cerrada la sesión Traccar de la cuenta '{account.key}'")
+
+    def get(self, user_id: int):
+        """Tenant del usuario de Telegram, o None si no está autorizado."""
+        self._maybe_reload()
+        return self.tenants.get(user_id)
+
+    def account_for(self, user_id: int):
+        tenant = self.get(user_id)
+        return tenant.account if tenant is not None else None
+
+    def stats(self) -> dict:
+        return {"users": len(self.tenants), "accounts": len(self.accounts), "reloads": self.reloads}
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> TenantRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = TenantRegistry()
+    return _registry
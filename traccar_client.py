@@ -0,0 +1,262 @@
+import codecs
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from log_config import bot_logger, error_logger
+from metrics import span
+
+_ = load_dotenv()
+
+TRACCAR_URL = os.getenv("TRACCAR_URL")
+
+# === Configuración de red ===
+# (connect, read) en segundos
+TRACCAR_TIMEOUT = (
+    float(os.getenv("TRACCAR_CONNECT_TIMEOUT", "3.05")),
+    float(os.getenv("TRACCAR_READ_TIMEOUT", "10")),
+)
+TRACCAR_RETRIES = int(os.getenv("TRACCAR_RETRIES", "2"))
+TRACCAR_BACKOFF = float(os.getenv("TRACCAR_BACKOFF", "0.3"))
+TRACCAR_POOL_SIZE = int(os.getenv("TRACCAR_POOL_SIZE", "10"))
+# Los informes de varios días tardan más en empezar a llegar
+TRACCAR_REPORT_TIMEOUT = float(os.getenv("TRACCAR_REPORT_TIMEOUT", "60"))
+REPORT_CHUNK_BYTES = 64 * 1024
+
+# Circuit breaker: tras N fallos seguidos se deja de llamar a Traccar durante un tiempo
+BREAKER_FAILURES = int(os.getenv("TRACCAR_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("TRACCAR_BREAKER_RESET", "30"))
+
+RETRYABLE_STATUS = {502, 503, 504}
+
+
+class TraccarError(Exception):
+    pass
+
+
+class CircuitOpenError(TraccarError):
+    pass
+
+
+def iter_json_array(chunks):
+    """Objetos de un array JSON a medida que llegan los bytes, sin cargar la respuesta completa."""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos = "", 0
+    started = finished = False
+    for chunk in chunks:
+        buffer = buffer[pos:] + text_decoder.decode(chunk)
+        pos = 0
+        while not finished:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise TraccarError("Se esperaba un array JSON en la respuesta de Traccar.")
+                started = True
+                pos += 1
+            elif buffer[pos] == "]":
+                finished = True
+            else:
+                try:
+                    item, pos = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    break  # elemento incompleto: faltan bytes
+                yield item
+        if finished:
+            # Se consume el resto para que la conexión vuelva al pool
+            for _ in chunks:
+                pass
+            return
+    raise TraccarError("Respuesta de Traccar incompleta.")
+
+
+class CircuitBreaker:
+    """Breaker simple de tres estados (closed / open / half-open)."""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            # Half-open: deja pasar una petición de prueba tras el tiempo de espera
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class TraccarClient:
+    """Cliente HTTP de Traccar con sesión persistente por credencial.
+
+    Reutiliza conexiones keep-alive, se autentica una vez vía `/api/session`
+    (cookie JSESSIONID) y aplica timeouts, reintentos con backoff y circuit breaker.
+    """
+
+    def __init__(self, base_url: str, username: str, password: str):
+        self.base_url = (base_url or "").rstrip("/")
+        self.username = username
+        self._password = password
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=TRACCAR_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept": "application/json"})
+        self.breaker = CircuitBreaker()
+        self._logged_in = False
+        self._login_lock = threading.Lock()
+
+    # === 🔐 Autenticación ===
+    def _login(self):
+        with self._login_lock:
+            if self._logged_in:
+                return
+            response = self.session.post(
+                f"{self.base_url}/api/session",
+                data={"email": self.username, "password": self._password},
+                timeout=TRACCAR_TIMEOUT,
+            )
+            if response.status_code == 401:
+                raise TraccarError("Credenciales de Traccar inválidas.")
+            response.raise_for_status()
+            self._logged_in = True
+            bot_logger.info(f"[TRACCAR] Sesión iniciada para {self.username}")
+
+    def session_cookie(self) -> str:
+        """Cabecera Cookie de la sesión activa (para `/api/socket`)."""
+        if not self._logged_in:
+            self._login()
+        return "; ".join(f"{c.name}={c.value}" for c in self.session.cookies)
+
+    def expire_session(self):
+        self._logged_in = False
+
+    # === 🌐 Peticiones ===
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        if not self.breaker.allow():
+            raise CircuitOpenError("Traccar no disponible temporalmente (circuit breaker abierto).")
+
+        kwargs.setdefault("timeout", TRACCAR_TIMEOUT)
+        url = f"{self.base_url}{path}"
+        reauthenticated = False
+        attempt = 0
+
+        while True:
+            try:
+                if not self._logged_in:
+                    self._login()
+                with span("traccar", f"{method} {path}"):
+                    response = self.session.request(method, url, **kwargs)
+
+                if response.status_code == 401 and not reauthenticated:
+                    # La sesión expiró en el servidor: vuelve a iniciarla una vez
+                    self.expire_session()
+                    reauthenticated = True
+                    continue
+                if response.status_code in RETRYABLE_STATUS and attempt < TRACCAR_RETRIES:
+                    raise requests.HTTPError(f"{response.status_code} en {path}", response=response)
+
+                response.raise_for_status()
+                self.breaker.record_success()
+                return response
+
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                status = getattr(e.response, "status_code", None)
+                retryable = status is None or status in RETRYABLE_STATUS
+                if not retryable or attempt >= TRACCAR_RETRIES:
+                    if retryable:
+                        self.breaker.record_failure()
+                    error_logger.error(f"[TRACCAR] {method} {path} falló: {e}")
+                    raise
+                delay = TRACCAR_BACKOFF * (2 ** attempt) * (1 + random.random())
+                attempt += 1
+                bot_logger.info(f"[TRACCAR] Reintento {attempt} de {method} {path} en {delay:.2f}s: {e}")
+                time.sleep(delay)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def get_devices(self) -> list:
+        return self.get("/api/devices").json()
+
+    def get_positions(self, position_ids=None) -> list:
+        params = {"id": position_ids} if position_ids is not None else None
+        return self.get("/api/positions", params=params).json()
+
+    def iter_report(self, kind: str, device_ids: list, start, end):
+        """Elementos de /api/reports/{kind} (route, trips, stops) parseados en streaming."""
+        params = {
+            "deviceId": device_ids,
+            "from": start.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "to": end.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        response = self.get(
+            f"/api/reports/{kind}", params=params, stream=True, timeout=(TRACCAR_TIMEOUT[0], TRACCAR_REPORT_TIMEOUT)
+        )
+        with response:
+            yield from iter_json_array(response.iter_content(chunk_size=REPORT_CHUNK_BYTES))
+
+    def close(self):
+        self.session.close()
+
+
+# === Registro de clientes (uno por credencial) ===
+_clients: dict = {}
+_clients_lock = threading.Lock()
+
+
+def _credential_key(username: str, password: str) -> tuple:
+    return (username, hashlib.sha256(password.encode("utf-8")).hexdigest())
+
+
+def get_client(username: str, password: str) -> TraccarClient:
+    key = _credential_key(username, password)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = TraccarClient(TRACCAR_URL, username, password)
+            _clients[key] = client
+        return client
+
+
+def close_client(username: str, password: str):
+    """Saca del registro y cierra el cliente de esa credencial; lo devuelve (None si no existía)."""
+    with _clients_lock:
+        client = _clients.pop(_credential_key(username, password), None)
+    if client is not None:
+        client.close()
+    return client
+
+
+def close_all():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
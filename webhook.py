@@ -0,0 +1,249 @@
+import asyncio
+import bisect
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import queue
+import secrets
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+from log_config import bot_logger, error_logger
+from shared_state import get_shared_state
+
+_ = load_dotenv()
+
+# === Configuración del modo webhook ===
+TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")              # URL pública HTTPS (p. ej. detrás de nginx)
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+# Sin secreto cualquiera que conozca la URL podría inyectar updates; si falta y el bot registra
+# el webhook (WEBHOOK_URL), se genera uno aleatorio en cada arranque
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", str(os.cpu_count() or 2)))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "60"))
+# Cada cuánto el ingress borra las claves caducadas de SharedState
+SHARED_STATE_PURGE_INTERVAL = 60
+
+# Campos de un Update de Telegram que traen el usuario que lo originó
+USER_FIELDS = ("message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+               "my_chat_member", "chat_member", "chat_join_request", "pre_checkout_query", "shipping_query")
+
+
+class HashRing:
+    """Hashing consistente con nodos virtuales: un usuario siempre cae en el mismo worker."""
+
+    def __init__(self, nodes, vnodes: int = 128):
+        self._ring = []
+        for node in nodes:
+            for i in range(vnodes):
+                self._ring.append((self._hash(f"{node}#{i}"), node))
+        self._ring.sort()
+        self._keys = [h for h, _ in self._ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+    def node_for(self, key) -> int:
+        index = bisect.bisect(self._keys, self._hash(str(key))) % len(self._ring)
+        return self._ring[index][1]
+
+
+def extract_user_id(update: dict):
+    for field in USER_FIELDS:
+        sender = (update.get(field) or {}).get("from")
+        if sender:
+            return sender["id"]
+    # Sin usuario (p. ej. channel_post): se reparte por update_id
+    return update.get("update_id")
+
+
+# === 👷 Worker: una Application de PTB sin Updater, alimentada desde una cola ===
+def run_worker(index: int, updates, build_application):
+    # El proceso principal coordina el apagado: Ctrl+C no debe cortar el worker a medias
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_worker_loop(index, updates, build_application))
+
+
+async def _worker_loop(index: int, updates, build_application):
+    from telegram import Update
+
+    app = build_application(updater=False)
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    bot_logger.info(f"[WEBHOOK] Worker {index} listo (pid {os.getpid()})")
+
+    loop = asyncio.get_running_loop()
+    while True:
+        data = await loop.run_in_executor(None, updates.get)
+        if data is None:
+            break
+        await app.update_queue.put(Update.de_json(data, app.bot))
+
+    # Drenado: stop() procesa lo que queda en la cola y espera a los handlers en curso
+    bot_logger.info(f"[WEBHOOK] Worker {index} drenando...")
+    await app.stop()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+    await app.shutdown()
+    bot_logger.info(f"[WEBHOOK] Worker {index} detenido")
+
+
+# === 🌐 Ingress: recibe los updates de Telegram y los reparte por usuario ===
+class WebhookServer:
+    def __init__(self, build_application, workers: int = WEBHOOK_WORKERS):
+        self.build_application = build_application
+        self.workers = workers
+        self.ring = HashRing(range(workers))
+        self._ctx = multiprocessing.get_context("spawn")
+        self.queues = [self._ctx.Queue(maxsize=WEBHOOK_QUEUE_SIZE) for _ in range(workers)]
+        self.processes = [None] * workers
+        self.draining = threading.Event()
+        self.shared_state = get_shared_state()
+        self.secret = WEBHOOK_SECRET
+        if not self.secret:
+            if not WEBHOOK_URL:
+                # El webhook se registró fuera del bot: no hay forma de saber qué secreto envía Telegram
+                raise SystemExit("[WEBHOOK] Define WEBHOOK_SECRET (o WEBHOOK_URL para generarlo al arrancar)")
+            self.secret = secrets.token_urlsafe(32)
+            bot_logger.info("[WEBHOOK] WEBHOOK_SECRET vacío: se usa un secreto aleatorio para este arranque")
+        self.httpd = ThreadingHTTPServer((WEBHOOK_LISTEN, WEBHOOK_PORT), self._handler_class())
+
+    def _start_worker(self, index: int):
+        # Cada worker escribe sus propios logs y expone métricas en su propio puerto
+        overrides = {"TRAKII_WORKER_ID": str(index)}
+        metrics_port = int(os.getenv("METRICS_PORT", "9108"))
+        if metrics_port:
+            overrides["METRICS_PORT"] = str(metrics_port + 1 + index)
+        previous = {k: os.environ.get(k) for k in overrides}
+        os.environ.update(overrides)
+        try:
+            process = self._ctx.Process(
+                target=run_worker,
+                args=(index, self.queues[index], self.build_application),
+                name=f"trakii-worker-{index}",
+            )
+            process.start()
+        finally:
+            for k, v in previous.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+        self.processes[index] = process
+
+    def _supervise(self):
+        # Relanza workers caídos; sus updates pendientes siguen en su cola
+        last_purge = time.monotonic()
+        while not self.draining.wait(5):
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    error_logger.error(f"[WEBHOOK] Worker {index} terminó (código {process.exitcode}); relanzando")
+                    self._start_worker(index)
+            # Cada update deja una clave de deduplicación (y cada cuenta un bucket): se borran las caducadas
+            if time.monotonic() - last_purge >= SHARED_STATE_PURGE_INTERVAL:
+                last_purge = time.monotonic()
+                try:
+                    self.shared_state.purge_expired()
+                except Exception as e:
+                    error_logger.error(f"[WEBHOOK] No se pudo purgar el estado compartido: {e}")
+
+    def dispatch(self, update: dict) -> bool:
+        update_id = update.get("update_id")
+        # Telegram reintenta la entrega si no recibe 200 a tiempo: se descartan duplicados
+        if update_id is not None and not self.shared_state.add(f"update:{update_id}", ttl=86400):
+            return True
+        index = self.ring.node_for(extract_user_id(update))
+        try:
+            self.queues[index].put(update, timeout=5)
+        except queue.Full:
+            self.shared_state.delete(f"update:{update_id}")
+            error_logger.error(f"[WEBHOOK] Cola del worker {index} llena; Telegram reintentará el update {update_id}")
+            return False
+        return True
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if server.draining.is_set():
+                    self.send_error(503)
+                    return
+                token = self.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+                if not hmac.compare_digest(token.encode("utf-8"), server.secret.encode("utf-8")):
+                    self.send_error(403)
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    update = json.loads(self.rfile.read(length))
+                except ValueError:
+                    self.send_error(400)
+                    return
+                self.send_response(200 if server.dispatch(update) else 503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    async def _register_webhook(self):
+        from telegram import Bot, Update
+
+        async with Bot(TELEGRAM_TOKEN) as bot:
+            await bot.set_webhook(
+                url=WEBHOOK_URL,
+                secret_token=self.secret,
+                allowed_updates=Update.ALL_TYPES,
+            )
+
+    def _request_stop(self, signum, frame):
+        if not self.draining.is_set():
+            bot_logger.info(f"[WEBHOOK] Señal {signum} recibida: dejando de aceptar updates")
+            self.draining.set()
+            # shutdown() bloquea hasta que serve_forever termina: se llama desde otro hilo
+            threading.Thread(target=self.httpd.shutdown, daemon=True).start()
+
+    def serve(self):
+        for index in range(self.workers):
+            self._start_worker(index)
+        if WEBHOOK_URL:
+            asyncio.run(self._register_webhook())
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        threading.Thread(target=self._supervise, name="trakii-webhook-supervisor", daemon=True).start()
+
+        bot_logger.info(
+            f"[WEBHOOK] Escuchando en {WEBHOOK_LISTEN}:{WEBHOOK_PORT} con {self.workers} workers"
+        )
+        self.httpd.serve_forever()
+        self.httpd.server_close()
+        self.drain()
+
+    def drain(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT):
+        for q in self.queues:
+            q.put(None)
+        for index, process in enumerate(self.processes):
+            process.join(timeout)
+            if process.is_alive():
+                error_logger.error(f"[WEBHOOK] Worker {index} no terminó en {timeout}s; se fuerza la salida")
+                process.terminate()
+        bot_logger.info("[WEBHOOK] Todos los workers detenidos")
+
+
+def run_webhook(build_application):
+    WebhookServer(build_application).serve()